@@ -1,8 +1,13 @@
+import os
+import sys
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import openpyxl
-from collections import defaultdict
-import sqlite3
+
+# Share the database connection setup and label counting with the main application in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from pscxl_database import connect
+import pscxl_ingest
 
 class PSCXL:
     def __init__(self, root):
@@ -63,7 +68,7 @@ class PSCXL:
         self.context_menu.add_command(label="Add Row", command=self.add_row)
 
         # Initialize SQLite database
-        self.conn = sqlite3.connect('pscxl.db')
+        self.conn = connect('pscxl.db')
         self.cursor = self.conn.cursor()
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS workbooks (
@@ -113,12 +118,7 @@ class PSCXL:
         return data
 
     def count_duplicates(self, data):
-        counter = defaultdict(int)
-        for row in data:
-            for value in row:
-                if value is not None:  # Skip empty cells
-                    counter[value] += 1
-        return counter
+        return pscxl_ingest.count_duplicates(data)
 
     def read_database(self):
         # Get unique workbook names and update the workbook selector
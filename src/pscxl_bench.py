@@ -0,0 +1,244 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+import openpyxl
+import pscxl_export
+from pscxl_database import PSCXL_Database
+from pscxl_import import import_workbooks
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# End-to-end benchmark: python -m pscxl_bench [--rows N] [--baseline results.jsonl]
+# Generates synthetic panel schedules, then times import, query and export headlessly.
+# Each stage runs in a fresh process, so its peak RSS is its own rather than the largest of the run.
+# Each stage prints one JSON line; with --baseline the run fails if a stage got slower or used more memory.
+
+# Label families seen in real panel schedules (see workbook_data.json)
+LABEL_FORMATS = ['L{n}', '{n}L{p}', '{n}L{p}A', '{n}', 'N{n}', 'G{n}']
+
+def make_label(rng, distinct):
+    n = rng.randrange(1, distinct + 1)
+    label = rng.choice(LABEL_FORMATS).format(n=n, p=n % 3 + 1)
+    # Stacked labels repeat the text with a run of spaces between, like "L1             L1"
+    if rng.random() < 0.8:
+        return f"{label}             {label}"
+    return label
+
+def generate_workbook(path, sheets=3, rows=10000, distinct=500, seed=0):
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook(write_only=True)
+    for index in range(sheets):
+        ws = wb.create_sheet(title="PANEL" if index == 0 else f"PANEL{index + 1}")
+        for _ in range(rows):
+            ws.append([make_label(rng, distinct)])
+    wb.save(path)
+
+# openpyxl writes every string inline; Excel writes them to the shared string table
+INLINE_STRING_CELL = re.compile(rb'<c ([^>]*?)t="inlineStr"><is><t[^>]*>(.*?)</t></is></c>', re.S)
+
+def to_shared_strings(source_path, path):
+    # Copy a workbook with its inline strings moved into xl/sharedStrings.xml, so imports take the
+    # shared-string (and spill) path of the direct reader
+    strings = {}
+
+    def shared_cell(match):
+        index = strings.setdefault(match.group(2), len(strings))
+        return b'<c ' + match.group(1) + b't="s"><v>' + str(index).encode() + b'</v></c>'
+
+    with zipfile.ZipFile(source_path) as source, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info.filename)
+            if info.filename.startswith('xl/worksheets/'):
+                data = INLINE_STRING_CELL.sub(shared_cell, data)
+            elif info.filename == 'xl/_rels/workbook.xml.rels':
+                data = data.replace(b'</Relationships>', b'<Relationship Id="rIdSharedStrings" '
+                                    b'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+                                    b'Target="sharedStrings.xml"/></Relationships>')
+            elif info.filename == '[Content_Types].xml':
+                data = data.replace(b'</Types>', b'<Override PartName="/xl/sharedStrings.xml" ContentType='
+                                    b'"application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>')
+            target.writestr(info, data)
+        items = b''.join(b'<si><t xml:space="preserve">' + text + b'</t></si>' for text in strings)
+        target.writestr('xl/sharedStrings.xml',
+                        b'<?xml version="1.0" encoding="UTF-8"?><sst xmlns="http://schemas.openxmlformats.org/'
+                        b'spreadsheetml/2006/main" uniqueCount="' + str(len(strings)).encode() + b'">' + items + b'</sst>')
+
+def peak_rss_mb():
+    # Peak resident set size of this process and of finished children (the import workers)
+    if resource is None:
+        return None
+    unit = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) * unit / (1024 * 1024), 1)
+
+def query_all(db):
+    # Walk every workbook and sheet the way the GUI selectors and table do
+    rows = 0
+    for workbook_name in db.fetch_workbooks():
+        for sheet_name in db.fetch_sheets(workbook_name):
+            db.count_data(workbook_name, sheet_name)
+            db.fetch_data_page(workbook_name, sheet_name, 0, 70)
+            rows += len(db.fetch_data(workbook_name, sheet_name))
+    return rows
+
+# Each stage takes the run's settings and returns the number of rows it handled
+def stage_import(run):
+    import_workbooks(run['paths'], run['db_name'], max_workers=run['workers'])
+    return run['cells']
+
+def stage_import_shared_strings(run):
+    import_workbooks(run['shared_paths'], run['shared_db_name'], max_workers=run['workers'])
+    return run['cells']
+
+def stage_query(run):
+    db = PSCXL_Database(run['db_name'])
+    try:
+        return query_all(db)
+    finally:
+        db.close()
+
+def stage_export(run):
+    return pscxl_export.export_to_excel(run['db_name'], run['export_path'])
+
+# (stage, function, environment overrides), in run order. import_spill forces the shared string table
+# out to the memory-mapped spill file, which the generated tables are too small to trigger by size.
+STAGES = [
+    ('import', stage_import, {}),
+    ('import_shared_strings', stage_import_shared_strings, {}),
+    ('import_spill', stage_import_shared_strings, {'PSCXL_INGEST_SHARED_STRINGS_SPILL_BYTES': '0'}),
+    ('query', stage_query, {}),
+    ('export', stage_export, {}),
+    # Unchanged files should be skipped almost for free
+    ('reimport', stage_import, {}),
+]
+
+def run_stage(stage, run, trace_heap, results):
+    # Runs in a child process. tracemalloc slows Python code down noticeably, so the heap peak is only
+    # tracked on request; compare timings from runs made without it.
+    _, func, environ = next(entry for entry in STAGES if entry[0] == stage)
+    os.environ.update(environ)
+    if trace_heap:
+        tracemalloc.start()
+    start = time.perf_counter()
+    rows = func(run)
+    seconds = time.perf_counter() - start
+    record = {
+        'event': 'bench',
+        'stage': stage,
+        'rows': rows,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(rows / seconds) if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if trace_heap:
+        _, heap_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        record['heap_peak_mb'] = round(heap_peak / (1024 * 1024), 1)
+    results.put(record)
+
+def measure(stage, run, trace_heap=False):
+    # ru_maxrss only ever grows, so each stage gets a fresh interpreter to report its own peak
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_stage, args=(stage, run, trace_heap, results))
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"Benchmark stage {stage} failed (exit code {process.exitcode})")
+    finally:
+        process.join()
+
+def run_benchmark(workbooks=2, sheets=3, rows=10000, distinct=500, workers=None, seed=0, trace_heap=False, work_dir=None):
+    work_dir = work_dir or tempfile.mkdtemp(prefix='pscxl_bench_')
+    results = []
+    try:
+        paths = []
+        shared_paths = []
+        for index in range(workbooks):
+            path = os.path.join(work_dir, f'BENCH-{index + 1:04d}.xlsx')
+            generate_workbook(path, sheets, rows, distinct, seed + index)
+            paths.append(path)
+            shared_path = os.path.join(work_dir, f'BENCH-SST-{index + 1:04d}.xlsx')
+            to_shared_strings(path, shared_path)
+            shared_paths.append(shared_path)
+        run = {
+            'paths': paths,
+            'shared_paths': shared_paths,
+            'db_name': os.path.join(work_dir, 'bench.db'),
+            'shared_db_name': os.path.join(work_dir, 'bench_shared.db'),
+            'export_path': os.path.join(work_dir, 'export.xlsx'),
+            'workers': workers,
+            'cells': workbooks * sheets * rows,
+        }
+        for stage, _, _ in STAGES:
+            if stage == 'import_spill':
+                os.remove(run['shared_db_name'])  # Import the same files again from scratch
+            results.append(measure(stage, run, trace_heap))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+# Measurements checked against the baseline; missing ones (no resource module, no --trace-heap) are skipped
+COMPARED_METRICS = ('seconds', 'peak_rss_mb', 'heap_peak_mb')
+
+def compare(results, baseline_path, tolerance):
+    # Returns the stages whose time or memory grew by more than tolerance (a fraction) over the baseline
+    with open(baseline_path, 'r') as file:
+        baseline = {record['stage']: record for record in map(json.loads, file) if record.get('event') == 'bench'}
+    regressions = []
+    for record in results:
+        previous = baseline.get(record['stage'])
+        if not previous:
+            continue
+        for metric in COMPARED_METRICS:
+            if previous.get(metric) and record.get(metric) is not None and \
+                    record[metric] > previous[metric] * (1 + tolerance):
+                regressions.append({'event': 'regression', 'stage': record['stage'], 'metric': metric,
+                                    'baseline': previous[metric], 'value': record[metric]})
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pscxl_bench', description="Benchmark import, query and export on synthetic workbooks.")
+    parser.add_argument('--workbooks', type=int, default=2, help="Number of workbooks to generate")
+    parser.add_argument('--sheets', type=int, default=3, help="Sheets per workbook")
+    parser.add_argument('--rows', type=int, default=10000, help="Label cells per sheet")
+    parser.add_argument('--distinct', type=int, default=500, help="Label numbers to draw from per family")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Import worker processes")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the generated labels")
+    parser.add_argument('--trace-heap', action='store_true', help="Also report the Python heap peak per stage (slower)")
+    parser.add_argument('--baseline', help="JSON lines from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed growth in time or memory over the baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.workbooks, args.sheets, args.rows, args.distinct, args.workers, args.seed,
+                            args.trace_heap)
+    for record in results:
+        print(json.dumps(record), flush=True)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for record in regressions:
+            print(json.dumps(record), flush=True)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
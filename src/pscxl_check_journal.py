@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import pscxl_logging
+from pscxl_database import PSCXL_Database
+
+# Check for the undo/redo change journal: python -m pscxl_check_journal [--operations N] [--seed S] [--limit L]
+# Applies random imports, edits, deletes, clears and restores to a PSCXL_Database with random undos and redos
+# in between, and tracks the expected history alongside: the state after every kept step, where undo and redo
+# are, redo steps dropped by a new write and the oldest steps dropped past the limit. After every operation
+# labels, the sheet and workbook names, workbook_label_totals and label_values must match the expected state
+# exactly and agree with labels, and an undo or redo must drop the fingerprints of every workbook it changed.
+# A small limit and few names keep sheets being emptied, pruned and recreated with new ids.
+# Prints one JSON line per failure and a summary; exits with 1 on any mismatch.
+
+WORKBOOKS = ['A', 'B', 'C']
+SHEETS = ['PANEL', 'PANEL2', 'PANEL3']
+VALUES = ['L1', 'L2             L2', 'a', 'B', 'é', '10', '9']
+
+def read_state(db):
+    # The journaled tables, by name rather than id: ids change when a pruned sheet is recreated
+    return {
+        'labels': db.conn.execute('''
+            SELECT w.name, s.name, l.value, l.quantity, l.stacked
+            FROM labels l JOIN sheet_names s ON s.sheet_id = l.sheet_id
+            JOIN workbook_names w ON w.workbook_id = s.workbook_id
+            ORDER BY 1, 2, 3
+        ''').fetchall(),
+        'sheets': db.conn.execute('''
+            SELECT w.name, s.name FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+            UNION ALL
+            SELECT name, NULL FROM workbook_names
+            WHERE NOT EXISTS (SELECT 1 FROM sheet_names s WHERE s.workbook_id = workbook_names.workbook_id)
+            ORDER BY 1, 2
+        ''').fetchall(),
+        'totals': db.conn.execute('''
+            SELECT w.name, t.value, t.stacked, t.quantity, t.sheets
+            FROM workbook_label_totals t JOIN workbook_names w ON w.workbook_id = t.workbook_id
+            ORDER BY 1, 2, 3
+        ''').fetchall(),
+        'values': db.conn.execute('SELECT value, refs FROM label_values ORDER BY value').fetchall(),
+    }
+
+def derived_state(labels):
+    # The sheet and workbook names, workbook_label_totals and label_values as pruning and the triggers
+    # should keep them for these labels
+    totals = {}
+    refs = {}
+    for workbook_name, _, value, quantity, stacked in labels:
+        key = (workbook_name, value, stacked or 0)
+        total = totals.get(key, (0, 0))
+        totals[key] = (total[0] + (quantity or 0), total[1] + 1)
+        refs[value] = refs.get(value, 0) + 1
+    sheets = sorted({(workbook_name, sheet_name) for workbook_name, sheet_name, *_ in labels})
+    return sheets, [key + total for key, total in sorted(totals.items())], sorted(refs.items())
+
+def random_import(rng):
+    # update_workbook_sheets arguments for a re-parse of some sheets of a random workbook
+    workbook_name = rng.choice(WORKBOOKS)
+    sheet_names = rng.sample(SHEETS, rng.randint(1, len(SHEETS)))
+    changed_rows = {sheet_name: {value: (rng.choice([rng.randint(1, 9), None]), int(' ' in value))
+                                 for value in rng.sample(VALUES, rng.randint(1, 4))}
+                    for sheet_name in rng.sample(sheet_names, rng.randint(1, len(sheet_names)))}
+    sheet_fingerprints = {sheet_name: f'{sheet_name}-{rng.random()}' for sheet_name in sheet_names}
+    return workbook_name, sheet_names, changed_rows, sheet_fingerprints, (rng.randint(1, 10 ** 6), rng.random())
+
+def random_operation(rng, saved_states):
+    # (method name, args) for one write, or ('undo', (steps,)) / ('redo', (steps,))
+    workbook_name, sheet_name, value = rng.choice(WORKBOOKS), rng.choice(SHEETS), rng.choice(VALUES)
+    roll = rng.random()
+    if roll < 0.2:
+        return 'update_workbook_sheets', random_import(rng)
+    if roll < 0.3:
+        return 'insert_data', (workbook_name, sheet_name, value, rng.choice([rng.randint(1, 9), None]), 0)
+    if roll < 0.4:
+        return 'update_data', (workbook_name, sheet_name, value, rng.choice(VALUES), rng.randint(1, 9), 0)
+    if roll < 0.47:
+        return 'delete_data', (workbook_name, sheet_name, value)
+    if roll < 0.52:
+        return 'insert_many', ([(workbook_name, sheet_name, new_value, 3, 0) for new_value in rng.sample(VALUES, 3)],)
+    if roll < 0.57:
+        # New values disjoint from the old ones, so a batch never renames a label and back in one step
+        values = rng.sample(VALUES, 4)
+        return 'update_many', ([(workbook_name, sheet_name, values[0], values[2], 4, 0),
+                                (workbook_name, sheet_name, values[1], values[3], None, 1)],)
+    if roll < 0.62:
+        return 'delete_many', ([(workbook_name, sheet_name, value) for value in rng.sample(VALUES, 3)],)
+    if roll < 0.67:
+        return 'clear_workbook_data', (workbook_name,)
+    if roll < 0.7 and saved_states:
+        return 'replace_all', (rng.choice(saved_states)['labels'],)
+    # Runs of undos long enough to reach the oldest step kept, and past it
+    return ('undo' if rng.random() < 0.6 else 'redo'), (rng.randint(1, 12),)
+
+def changed_workbooks(before, after):
+    return {row[0] for row in set(before['labels']) ^ set(after['labels'])}
+
+def check_state(db, expected):
+    # None when the database holds expected and its derived tables agree with its labels, otherwise what differs
+    state = read_state(db)
+    for table in ('labels', 'sheets', 'totals', 'values'):
+        if state[table] != expected[table]:
+            return f'{table} differ from the expected state'
+    if derived_state(state['labels']) != (state['sheets'], state['totals'], state['values']):
+        return 'names or derived tables disagree with labels'
+    return None
+
+def run_check(operations=2000, seed=0, limit=8, work_dir=None):
+    # Returns a list of failure records
+    work_dir = work_dir or tempfile.mkdtemp(prefix='pscxl_check_')
+    failures = []
+    db = PSCXL_Database(os.path.join(work_dir, 'check.db'))
+    db.journal_limit = limit
+    try:
+        rng = random.Random(seed)
+        states = [read_state(db)]  # The state after each step still in the journal, oldest first
+        position = 0  # Index in states of the current state; steps after it can be redone
+        for index in range(operations):
+            method, args = random_operation(rng, states)
+            before = states[position]
+            detail = None
+            if method in ('undo', 'redo'):
+                for _ in range(args[0]):
+                    before = states[position]
+                    target = position - 1 if method == 'undo' else position + 1
+                    description = getattr(db, method)()
+                    if not 0 <= target < len(states):
+                        if description is not None:
+                            detail = f'{method} applied {description!r} with nothing to {method}'
+                        break
+                    position = target
+                    if description is None:
+                        detail = f'nothing to {method}'
+                        break
+                    stale = [workbook_name for workbook_name in changed_workbooks(before, states[position])
+                             if db.fetch_file_fingerprint(workbook_name) is not None
+                             or db.fetch_sheet_fingerprints(workbook_name)]
+                    if stale:
+                        detail = f'fingerprints kept for {sorted(stale)}'
+                    detail = detail or check_state(db, states[position])
+                    if detail:
+                        break
+            else:
+                if method == 'replace_all' and args[0] == before['labels']:
+                    continue  # Deletes and reinserts every row: a kept step that changes nothing
+                try:
+                    getattr(db, method)(*args)
+                except sqlite3.IntegrityError:
+                    pass  # Renames onto an existing value change nothing
+                after = read_state(db)
+                if after['labels'] != before['labels']:
+                    # A kept step drops the redo steps and the oldest steps past the limit
+                    del states[position + 1:]
+                    states.append(after)
+                    del states[:max(0, len(states) - 1 - limit)]
+                    position = len(states) - 1
+            detail = detail or check_state(db, states[position])
+            if detail:
+                failures.append({'event': 'mismatch', 'operation': index, 'method': method,
+                                 'args': repr(args), 'detail': detail})
+                break  # Later operations would only repeat the first difference
+    finally:
+        db.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pscxl_check_journal',
+                                     description="Check that undo and redo restore the label tables exactly.")
+    parser.add_argument('--operations', type=int, default=2000, help="Random writes, undos and redos to apply")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the operations")
+    parser.add_argument('--limit', type=int, default=8, help="Undo steps to keep (journal max_change_sets)")
+    args = parser.parse_args(argv)
+    # The renames that collide on purpose log errors; send them to the log file, not the console
+    pscxl_logging.setup_logging()
+
+    failures = run_check(args.operations, args.seed, args.limit)
+    for record in failures:
+        print(json.dumps(record), flush=True)
+    print(json.dumps({'event': 'summary', 'operations': args.operations, 'seed': args.seed, 'limit': args.limit,
+                      'mismatches': len(failures)}), flush=True)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
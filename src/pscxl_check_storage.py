@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import pscxl_logging
+from pscxl_database import PSCXL_Database
+from pscxl_storage import PSCXL_MemoryStorage
+
+# Parity check for the storage backends: python -m pscxl_check_storage [--operations N] [--seed S]
+# Applies the same random inserts, edits, deletes and clears to a PSCXL_Database and a
+# PSCXL_MemoryStorage and compares everything the interface can read after every operation, then
+# checks that a snapshot restores into both stores unchanged.
+# Prints one JSON line per failure and a summary; exits with 1 on any mismatch.
+
+WORKBOOKS = ['A', 'B']
+SHEETS = ['PANEL', 'PANEL2']
+# Stacked and plain labels, mixed case, non-ASCII and numeric text, which sort differently as numbers
+VALUES = ['L1', 'L2             L2', 'a', 'B', 'é', '10', '9', 'N1']
+
+def read_store(store):
+    # Everything the interface can read, in the order the store returns it
+    state = {'workbooks': store.fetch_workbooks(), 'labels': list(store.iter_labels())}
+    for workbook_name in state['workbooks']:
+        for sheet_name in store.fetch_sheets(workbook_name):
+            state[(workbook_name, sheet_name)] = (
+                store.fetch_sheets(workbook_name),
+                list(store.fetch_data(workbook_name, sheet_name)),
+                store.count_data(workbook_name, sheet_name),
+                store.fetch_data_page(workbook_name, sheet_name, 3, 5),
+                store.fetch_data_page(workbook_name, sheet_name, 2, -1),
+            )
+    return state
+
+def random_operation(rng):
+    # (method name, args) for one write through the storage interface
+    workbook_name, sheet_name, value = rng.choice(WORKBOOKS), rng.choice(SHEETS), rng.choice(VALUES)
+    roll = rng.random()
+    if roll < 0.3:
+        return 'insert_data', (workbook_name, sheet_name, value, rng.randint(1, 9), int(' ' in value))
+    if roll < 0.35:
+        # Quantity and stacked are nullable columns
+        return 'insert_data', (workbook_name, sheet_name, value, None, rng.choice([None, 0]))
+    if roll < 0.55:
+        return 'delete_data', (workbook_name, sheet_name, value)
+    if roll < 0.8:
+        # Renames onto a value already on the sheet must fail the same way in both stores
+        new_quantity = rng.choice([rng.randint(1, 9), None])
+        return 'update_data', (workbook_name, sheet_name, value, rng.choice(VALUES), new_quantity, rng.randint(0, 1))
+    if roll < 0.95:
+        return 'insert_many', ([(workbook_name, sheet_name, new_value, 2, 0) for new_value in rng.sample(VALUES, 3)],)
+    return 'clear_workbook_data', (workbook_name,)
+
+def apply_operation(store, method, args):
+    # The error type, or None
+    try:
+        getattr(store, method)(*args)
+    except sqlite3.Error as e:
+        return type(e).__name__
+    return None
+
+def run_check(operations=3000, seed=0, work_dir=None):
+    # Returns a list of failure records
+    work_dir = work_dir or tempfile.mkdtemp(prefix='pscxl_check_')
+    failures = []
+    db = PSCXL_Database(os.path.join(work_dir, 'check.db'))
+    memory = PSCXL_MemoryStorage()
+    try:
+        rng = random.Random(seed)
+        for index in range(operations):
+            method, args = random_operation(rng)
+            errors = (apply_operation(db, method, args), apply_operation(memory, method, args))
+            if errors[0] != errors[1]:
+                failures.append({'event': 'mismatch', 'operation': index, 'method': method, 'args': repr(args),
+                                 'detail': f'errors differ: sqlite {errors[0]}, memory {errors[1]}'})
+            elif read_store(db) != read_store(memory):
+                failures.append({'event': 'mismatch', 'operation': index, 'method': method, 'args': repr(args),
+                                 'detail': 'stores differ'})
+            if failures:
+                break  # Later operations would only repeat the first difference
+
+        # Round trip: a snapshot of the SQLite store restores into both stores unchanged
+        expected = read_store(db)
+        snapshot = db.snapshot()
+        db.clear_workbook_data(WORKBOOKS[0])
+        db.restore(snapshot)
+        memory = PSCXL_MemoryStorage()
+        memory.restore(snapshot)
+        for name, store in (('sqlite', db), ('memory', memory)):
+            if read_store(store) != expected:
+                failures.append({'event': 'mismatch', 'operation': 'restore', 'method': name,
+                                 'detail': 'restored store differs from the snapshot source'})
+    finally:
+        db.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pscxl_check_storage',
+                                     description="Check the in-memory storage backend against the SQLite one.")
+    parser.add_argument('--operations', type=int, default=3000, help="Random writes to apply to both stores")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the operations")
+    args = parser.parse_args(argv)
+    # The renames that collide on purpose log errors; send them to the log file, not the console
+    pscxl_logging.setup_logging()
+
+    failures = run_check(args.operations, args.seed)
+    for record in failures:
+        print(json.dumps(record), flush=True)
+    print(json.dumps({'event': 'summary', 'operations': args.operations, 'seed': args.seed,
+                      'mismatches': len(failures)}), flush=True)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
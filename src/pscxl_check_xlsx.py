@@ -0,0 +1,115 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import openpyxl
+import pscxl_bench
+import pscxl_ingest
+import pscxl_xlsx
+from pscxl_import import find_workbooks
+
+# Parity check for the direct xlsx reader: python -m pscxl_check_xlsx [workbooks or folders...]
+# Counts every sheet with the direct reader and with openpyxl and fails if the Counters differ in
+# counts, key order or key types; imports store the first key of each label, so all three matter.
+# The direct reader runs twice per file, with the shared strings in memory and spilled to disk.
+# Without arguments it checks generated workbooks: the benchmark's panel schedules (inline and shared
+# strings) and a workbook of mixed cell types.
+# Prints one JSON line per sheet and reader mode; exits with 1 on any mismatch.
+
+# (mode, spill_bytes for PSCXL_XlsxReader)
+READER_MODES = (('memory', None), ('spill', 0))
+
+def generate_mixed_workbook(path):
+    # Values that hash alike but have different types (1, 1.0, True), numbers in both notations,
+    # formulas, escaped text, and a date sheet the direct reader hands to openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title="MIXED")
+    ws.append(["L1             L1", "L1", 1, 1.0, True])
+    ws.append([2.5, 1e20, "7", False, None])
+    ws.append(["=A1", "=SUM(C1:C2)", " padded ", 0, -3])
+    ws.append(["L1", 1, True, "x&y<z>", "L1             L1"])
+    ws = wb.create_sheet(title="DATES")
+    ws.append([datetime.datetime(2024, 1, 2), "L1"])
+    wb.save(path)
+
+def generate_workbooks(work_dir):
+    paths = []
+    for name, generate in (('PANELS', lambda path: pscxl_bench.generate_workbook(path, 2, 2000, 300)),
+                           ('MIXED', generate_mixed_workbook)):
+        path = os.path.join(work_dir, f'{name}.xlsx')
+        generate(path)
+        shared_path = os.path.join(work_dir, f'{name}-SST.xlsx')
+        pscxl_bench.to_shared_strings(path, shared_path)
+        paths.extend([path, shared_path])
+    return paths
+
+def openpyxl_counts(file_path):
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        return [(sheet_name, pscxl_ingest.count_sheet_values(wb[sheet_name])) for sheet_name in wb.sheetnames]
+    finally:
+        wb.close()
+
+def compare_counts(expected, actual):
+    # None when the Counters match, otherwise what differs
+    if expected != actual:
+        return 'counts differ'
+    if list(expected) != list(actual):
+        return 'key order differs'
+    for expected_key, actual_key in zip(expected, actual):
+        if type(expected_key) is not type(actual_key):
+            return f'key {expected_key!r} is {type(actual_key).__name__}, expected {type(expected_key).__name__}'
+    return None
+
+def check_workbook(file_path):
+    # Yields one record per sheet and reader mode
+    expected_sheets = openpyxl_counts(file_path)
+    for mode, spill_bytes in READER_MODES:
+        with pscxl_xlsx.PSCXL_XlsxReader(file_path, spill_bytes) as reader:
+            if reader.sheet_names != [sheet_name for sheet_name, _ in expected_sheets]:
+                yield {'event': 'check', 'file': file_path, 'mode': mode, 'sheet': None, 'result': 'mismatch',
+                       'detail': f'sheet names {reader.sheet_names}'}
+                continue
+            for sheet_name, expected in expected_sheets:
+                record = {'event': 'check', 'file': file_path, 'mode': mode, 'sheet': sheet_name}
+                try:
+                    detail = compare_counts(expected, reader.count_sheet(sheet_name))
+                except pscxl_xlsx.PSCXL_UnsupportedXlsx as e:
+                    # Imports read these sheets through openpyxl, so there is nothing to compare
+                    record.update(result='fallback', detail=str(e))
+                else:
+                    record.update(result='mismatch' if detail else 'ok', detail=detail)
+                yield record
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='pscxl_check_xlsx',
+                                     description="Check the direct xlsx reader against openpyxl.")
+    parser.add_argument('paths', nargs='*', help="Workbooks or folders to check (default: generated workbooks)")
+    args = parser.parse_args(argv)
+
+    work_dir = None
+    if args.paths:
+        file_paths = []
+        for path in args.paths:
+            file_paths.extend(find_workbooks(path) if os.path.isdir(path) else [path])
+    else:
+        work_dir = tempfile.mkdtemp(prefix='pscxl_check_')
+        file_paths = generate_workbooks(work_dir)
+
+    results = {'ok': 0, 'fallback': 0, 'mismatch': 0}
+    try:
+        for file_path in file_paths:
+            for record in check_workbook(file_path):
+                results[record['result']] += 1
+                print(json.dumps(record), flush=True)
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(dict({'event': 'summary', 'files': len(file_paths)}, **results)), flush=True)
+    return 1 if results['mismatch'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
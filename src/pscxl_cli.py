@@ -0,0 +1,198 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import pscxl_export
+import pscxl_logging
+from pscxl_database import PSCXL_Database
+from pscxl_import import import_workbooks, find_workbooks
+from pscxl_watch import PSCXL_Watcher
+
+# Headless entry point: python -m pscxl_cli import|export|stats|totals|search|undo|redo|history|watch
+# Nothing here imports tkinter, so it runs on servers without a display (e.g. from cron).
+# Every command prints one JSON object per line on stdout.
+
+def emit(record):
+    print(json.dumps(record), flush=True)
+
+def expand_paths(patterns):
+    # Accept files, folders and glob patterns (Windows shells don't expand globs themselves)
+    file_paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            file_paths.extend(find_workbooks(pattern))
+        else:
+            matches = sorted(glob.glob(pattern))
+            file_paths.extend(matches if matches else [pattern])
+    # Keep the first occurrence of each file
+    return list(dict.fromkeys(os.path.abspath(path) for path in file_paths))
+
+def run_import(args):
+    file_paths = expand_paths(args.paths)
+    start = time.perf_counter()
+    results = import_workbooks(file_paths, args.db, max_workers=args.workers, force=args.force)
+    seconds = time.perf_counter() - start
+
+    errors = 0
+    changed = 0
+    for file_path, workbook_name, changed_rows, error in results:
+        errors += bool(error)
+        changed += changed_rows
+        emit({'event': 'import', 'file': file_path, 'workbook': workbook_name,
+              'changed_rows': changed_rows, 'error': error})
+    emit({'event': 'summary', 'command': 'import', 'files': len(file_paths), 'errors': errors,
+          'changed_rows': changed, 'seconds': round(seconds, 3)})
+    return 1 if errors else 0
+
+def run_export(args):
+    start = time.perf_counter()
+    row_count = pscxl_export.export_data(args.db, args.output, args.layout, args.format)
+    seconds = time.perf_counter() - start
+    emit({'event': 'summary', 'command': 'export', 'output': os.path.abspath(args.output),
+          'format': args.format or pscxl_export.export_format(args.output), 'layout': args.layout, 'rows': row_count,
+          'seconds': round(seconds, 3), 'rows_per_second': round(row_count / seconds) if seconds else None})
+    return 0
+
+def run_stats(args):
+    start = time.perf_counter()
+    db = PSCXL_Database(args.db)
+    try:
+        stats = db.fetch_stats()
+    finally:
+        db.close()
+    emit(dict({'event': 'summary', 'command': 'stats'}, **stats, seconds=round(time.perf_counter() - start, 3)))
+    return 0
+
+def run_totals(args):
+    # One line per label with its total across the selected workbooks, then the stacked/unstacked sums
+    start = time.perf_counter()
+    db = PSCXL_Database(args.db)
+    try:
+        totals = db.fetch_label_totals(args.workbook, args.sheet)
+    finally:
+        db.close()
+    stacked_quantity = 0
+    unstacked_quantity = 0
+    for value, stacked, quantity in totals:
+        if stacked:
+            stacked_quantity += quantity
+        else:
+            unstacked_quantity += quantity
+        emit({'event': 'total', 'value': value, 'stacked': bool(stacked), 'quantity': quantity})
+    emit({'event': 'summary', 'command': 'totals', 'labels': len(totals), 'stacked_quantity': stacked_quantity,
+          'unstacked_quantity': unstacked_quantity, 'seconds': round(time.perf_counter() - start, 3)})
+    return 0
+
+def run_search(args):
+    start = time.perf_counter()
+    db = PSCXL_Database(args.db)
+    matches = 0
+    try:
+        for workbook_name, sheet_name, value, display_value, quantity, stacked in db.search_labels(args.query, args.limit):
+            matches += 1
+            emit({'event': 'match', 'workbook': workbook_name, 'sheet': sheet_name, 'value': value,
+                  'quantity': quantity, 'stacked': bool(stacked)})
+    finally:
+        db.close()
+    emit({'event': 'summary', 'command': 'search', 'query': args.query, 'matches': matches,
+          'seconds': round(time.perf_counter() - start, 3)})
+    return 0
+
+def run_history_step(args):
+    # undo and redo
+    db = PSCXL_Database(args.db)
+    try:
+        description = db.undo() if args.command == 'undo' else db.redo()
+    finally:
+        db.close()
+    emit({'event': 'summary', 'command': args.command, 'change': description})
+    return 0 if description is not None else 1
+
+def run_history(args):
+    db = PSCXL_Database(args.db)
+    try:
+        history = db.fetch_history(args.limit)
+    finally:
+        db.close()
+    for change_set_id, description, created, undone, changes in history:
+        emit({'event': 'change_set', 'id': change_set_id, 'description': description,
+              'created': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created)), 'undone': bool(undone),
+              'changes': changes})
+    emit({'event': 'summary', 'command': 'history', 'change_sets': len(history)})
+    return 0
+
+def run_watch(args):
+    # Runs until interrupted (Ctrl+C), or for a single scan with --once
+    def report(file_path, workbook_name, changed_rows, error):
+        emit({'event': 'import', 'file': file_path, 'workbook': workbook_name,
+              'changed_rows': changed_rows, 'error': error})
+
+    watcher = PSCXL_Watcher.from_config(args.db, args.folder, report)
+    if args.once:
+        watcher.settle_seconds = 0
+        results = watcher.poll()
+        emit({'event': 'summary', 'command': 'watch', 'folder': os.path.abspath(watcher.folder), 'files': len(results),
+              'errors': sum(bool(error) for _, _, _, error in results)})
+        return 0
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='pscxl_cli', description="Import, export and inspect the PSCXL label database.")
+    parser.add_argument('--db', default='pscxl.db', help="Path to the SQLite database (default: pscxl.db)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="Import Excel workbooks")
+    import_parser.add_argument('paths', nargs='+', help="Workbook files, folders or glob patterns")
+    import_parser.add_argument('-j', '--workers', type=int, default=None, help="Parser processes (default: one per CPU)")
+    import_parser.add_argument('-f', '--force', action='store_true', help="Re-read workbooks even if they look unchanged")
+    import_parser.set_defaults(func=run_import)
+
+    export_parser = commands.add_parser('export', help="Export every label to an Excel workbook or CSV/TSV file")
+    export_parser.add_argument('output', help="Path of the .xlsx, .csv or .tsv file to write")
+    export_parser.add_argument('--layout', choices=pscxl_export.EXPORT_LAYOUTS, default='expanded',
+                               help="expanded: one row per label printed; compact: value, quantity, stacked")
+    export_parser.add_argument('--format', choices=pscxl_export.EXPORT_FORMATS, default=None,
+                               help="Output format (default: from the file extension)")
+    export_parser.set_defaults(func=run_export)
+
+    stats_parser = commands.add_parser('stats', help="Print database totals")
+    stats_parser.set_defaults(func=run_stats)
+
+    totals_parser = commands.add_parser('totals', help="Print label quantities totalled across workbooks")
+    totals_parser.add_argument('-w', '--workbook', action='append', help="Only this workbook (repeatable; default: all)")
+    totals_parser.add_argument('-s', '--sheet', action='append', help="Only sheets with this name (repeatable; default: all)")
+    totals_parser.set_defaults(func=run_totals)
+
+    search_parser = commands.add_parser('search', help="Find every job and sheet using labels that contain some text")
+    search_parser.add_argument('query', help="Text to look for (case-insensitive)")
+    search_parser.add_argument('-n', '--limit', type=int, default=-1, help="Stop after this many matches (default: all)")
+    search_parser.set_defaults(func=run_search)
+
+    undo_parser = commands.add_parser('undo', help="Revert the latest import, edit or delete")
+    undo_parser.set_defaults(func=run_history_step)
+    redo_parser = commands.add_parser('redo', help="Re-apply the change undone last")
+    redo_parser.set_defaults(func=run_history_step)
+
+    history_parser = commands.add_parser('history', help="List the changes that can be undone or redone, newest first")
+    history_parser.add_argument('-n', '--limit', type=int, default=20, help="Number of change sets to list (default: 20)")
+    history_parser.set_defaults(func=run_history)
+
+    watch_parser = commands.add_parser('watch', help="Keep importing new and changed workbooks from a folder")
+    watch_parser.add_argument('folder', nargs='?', default=None, help="Folder to watch (default: [watch] folder in pscxl.ini)")
+    watch_parser.add_argument('--once', action='store_true', help="Import what is in the folder now and exit")
+    watch_parser.set_defaults(func=run_watch)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    pscxl_logging.setup_logging()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import configparser
+import os
+
+# Settings are read from pscxl.ini in the working directory (or the file named by PSCXL_CONFIG),
+# and any option can be overridden with an environment variable named PSCXL_<SECTION>_<OPTION>,
+# e.g. PSCXL_DATABASE_SYNCHRONOUS=full
+DEFAULTS = {
+    'database': {
+        # WAL lets the GUI keep reading while import/export workers write.
+        # Use "delete" if the database file sits on a network share, where WAL isn't supported.
+        'journal_mode': 'wal',
+        # "normal" is safe with WAL and avoids an fsync on every commit
+        'synchronous': 'normal',
+        # Negative values are KiB, so this is a 20 MB page cache per connection
+        'cache_size': '-20000',
+        'mmap_size': '268435456',
+        'temp_store': 'memory',
+        # Milliseconds to wait on a locked database before giving up
+        'busy_timeout': '5000',
+    },
+    'ingest': {
+        # "direct" counts labels straight from the xlsx XML (falling back to openpyxl for sheets with
+        # formulas, dates or anything else it doesn't handle); "openpyxl" always uses openpyxl
+        'xlsx_reader': 'direct',
+        # Shared string tables larger than this (bytes of XML) are spilled to a memory-mapped temporary
+        # file instead of being held as Python strings; -1 never spills
+        'shared_strings_spill_bytes': '16777216',
+    },
+    'journal': {
+        # Undo steps kept in the change journal (each import, edit or delete is one step); 0 turns it off
+        'max_change_sets': '50',
+    },
+    'watch': {
+        # Folder the watcher (pscxl_cli watch) imports new and changed workbooks from
+        'folder': '',
+        # Seconds between scans of the folder
+        'poll_seconds': '5',
+        # A file is imported once its size and modification time have held for this many seconds,
+        # so workbooks still being copied in aren't read half-written
+        'settle_seconds': '2',
+        # Parser processes per batch of files; 0 uses one per CPU
+        'workers': '0',
+    },
+    'logging': {
+        # DEBUG, INFO, WARNING, ERROR or CRITICAL. INFO keeps the timing spans; DEBUG adds per-action detail.
+        'level': 'info',
+        'file': 'pscxl_log.txt',
+        # Rotate to pscxl_log.txt.1, .2, ... at 1 MB instead of truncating on every start
+        'max_bytes': '1048576',
+        'backup_count': '3',
+    },
+}
+
+def config_path():
+    return os.environ.get('PSCXL_CONFIG', 'pscxl.ini')
+
+def load_config(path=None):
+    config = configparser.ConfigParser()
+    config.read_dict(DEFAULTS)
+    config.read(path or config_path())  # A missing file just leaves the defaults
+
+    for section in config.sections():
+        for option in config.options(section):
+            env_name = f'PSCXL_{section}_{option}'.upper()
+            if env_name in os.environ:
+                config.set(section, option, os.environ[env_name])
+    return config
@@ -1,69 +1,1048 @@
 import logging
 import sqlite3
-import openpyxl
+import time
+from collections import OrderedDict
+import pscxl_config
+from pscxl_labels import DISPLAY_VALUE_SQL, PRINT_VALUE_SQL
+from pscxl_storage import PSCXL_Storage
+from pscxl_timing import span
 
-class PSCXL_Database:
+JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off')
+SYNCHRONOUS_MODES = ('off', 'normal', 'full', 'extra')
+TEMP_STORE_MODES = ('default', 'file', 'memory')
+
+def connect(db_name="pscxl.db"):
+    # Every front end and worker opens the database through here so they all get the same pragmas
+    settings = pscxl_config.load_config()['database']
+    journal_mode = settings.get('journal_mode').lower()
+    synchronous = settings.get('synchronous').lower()
+    temp_store = settings.get('temp_store').lower()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"Invalid journal_mode: {journal_mode}")
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Invalid synchronous: {synchronous}")
+    if temp_store not in TEMP_STORE_MODES:
+        raise ValueError(f"Invalid temp_store: {temp_store}")
+
+    conn = sqlite3.connect(db_name, timeout=settings.getint('busy_timeout') / 1000)
+    conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    conn.execute(f'PRAGMA cache_size = {settings.getint("cache_size")}')
+    conn.execute(f'PRAGMA mmap_size = {settings.getint("mmap_size")}')
+    conn.execute(f'PRAGMA temp_store = {temp_store}')
+    return conn
+
+QUERY_CACHE_SIZE = 256  # Result sets kept by the read-through cache, least recently used dropped first
+
+# Resolves a (workbook name, sheet name) pair to its sheet_id through the name indexes
+SHEET_ID_SQL = '''
+    SELECT s.sheet_id FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+    WHERE w.name = ? AND s.name = ?
+'''
+
+class PSCXL_Database(PSCXL_Storage):
     def __init__(self, db_name="pscxl.db"):
-        self.conn = sqlite3.connect(db_name)
+        self.db_name = db_name
+        self.conn = connect(db_name)
         self.cursor = self.conn.cursor()
+        self.query_cache = OrderedDict()
+        self.cache_data_version = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.search_index = None
+        # Undo steps kept in the change journal; 0 turns journaling off
+        self.journal_limit = pscxl_config.load_config()['journal'].getint('max_change_sets')
         self.init_database()
 
+    def close(self):
+        self.conn.close()
+
+    # Read-through cache for the selector and table queries. Writes made through this object call
+    # invalidate_cache(); commits from other connections (import workers, the CLI) are picked up through
+    # PRAGMA data_version, which changes whenever another connection commits to the file.
+    def cached(self, key, load):
+        self.cursor.execute('PRAGMA data_version')
+        data_version = self.cursor.fetchone()[0]
+        if data_version != self.cache_data_version:
+            self.query_cache.clear()
+            self.cache_data_version = data_version
+        if key in self.query_cache:
+            self.cache_hits += 1
+            self.query_cache.move_to_end(key)
+            return list(self.query_cache[key])  # Callers get their own copy to modify
+        self.cache_misses += 1
+        with span('query', query=key[0]) as record:
+            result = load()
+            record['rows'] = len(result)
+        self.query_cache[key] = result
+        if len(self.query_cache) > QUERY_CACHE_SIZE:
+            self.query_cache.popitem(last=False)
+        return list(result)
+
+    def invalidate_cache(self):
+        self.query_cache.clear()
+
+    def cache_stats(self):
+        return {'hits': self.cache_hits, 'misses': self.cache_misses, 'entries': len(self.query_cache)}
+
+    # Schema migrations, applied in order. PRAGMA user_version records how many have run.
+    def migrations(self):
+        return [self.migrate_normalized_names, self.migrate_label_forms, self.migrate_label_totals,
+                self.migrate_label_search, self.migrate_change_journal, self.migrate_ingest_status]
+
+    def schema_version(self):
+        self.cursor.execute('PRAGMA user_version')
+        return self.cursor.fetchone()[0]
+
     def init_database(self):
+        migrations = self.migrations()
+        if self.schema_version() >= len(migrations):
+            return
+
+        # Take the write lock before re-checking so two connections opening an old file
+        # (e.g. the GUI and an import worker) can't both run the same migration
+        self.cursor.execute('BEGIN IMMEDIATE')
+        try:
+            version = self.schema_version()
+            for migration in migrations[version:]:
+                logging.debug('Migrating database to version %d: %s', version + 1, migration.__name__)
+                migration()
+                version += 1
+                self.cursor.execute(f'PRAGMA user_version = {version}')
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            logging.error(f"Error migrating database: {e}")
+            raise
+
+    def migrate_normalized_names(self):
+        # Version 1: workbook and sheet names live in their own tables with integer ids, and labels are
+        # clustered by (sheet_id, value) in a WITHOUT ROWID table, so reading a sheet is one range scan of
+        # the primary key and the selectors read the small name indexes instead of scanning every label.
+        # The original workbooks table becomes a view with the same columns.
+        self.cursor.execute('''
+            CREATE TABLE workbook_names (
+                workbook_id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE sheet_names (
+                sheet_id INTEGER PRIMARY KEY,
+                workbook_id INTEGER NOT NULL REFERENCES workbook_names (workbook_id),
+                name TEXT NOT NULL,
+                UNIQUE (workbook_id, name)
+            )
+        ''')
         self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS workbooks (
-                workbook_name TEXT, 
-                sheet_name TEXT, 
-                value TEXT, 
+            CREATE TABLE labels (
+                sheet_id INTEGER NOT NULL REFERENCES sheet_names (sheet_id),
+                value TEXT NOT NULL,
                 quantity INTEGER,
                 stacked INTEGER,
-                PRIMARY KEY (workbook_name, sheet_name, value)
+                PRIMARY KEY (sheet_id, value)
+            ) WITHOUT ROWID
+        ''')
+
+        # File and per-sheet fingerprints from the last incremental import of each workbook
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS workbook_fingerprints (
+                workbook_name TEXT PRIMARY KEY,
+                file_size INTEGER,
+                file_mtime REAL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sheet_fingerprints (
+                workbook_name TEXT,
+                sheet_name TEXT,
+                fingerprint TEXT,
+                PRIMARY KEY (workbook_name, sheet_name)
             )
         ''')
-        self.conn.commit()
 
-    def insert_data(self, workbook_name, sheet_name, value, quantity, stacked):
+        # Carry over rows from the original single-table layout
+        self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'workbooks'")
+        if self.cursor.fetchone():
+            self.cursor.execute('''
+                INSERT INTO workbook_names (name)
+                SELECT DISTINCT workbook_name FROM workbooks WHERE workbook_name IS NOT NULL ORDER BY workbook_name
+            ''')
+            self.cursor.execute('''
+                INSERT INTO sheet_names (workbook_id, name)
+                SELECT DISTINCT w.workbook_id, o.sheet_name
+                FROM workbooks o JOIN workbook_names w ON w.name = o.workbook_name
+                WHERE o.sheet_name IS NOT NULL
+                ORDER BY w.workbook_id, o.sheet_name
+            ''')
+            self.cursor.execute('''
+                INSERT OR IGNORE INTO labels (sheet_id, value, quantity, stacked)
+                SELECT s.sheet_id, o.value, o.quantity, o.stacked
+                FROM workbooks o
+                JOIN workbook_names w ON w.name = o.workbook_name
+                JOIN sheet_names s ON s.workbook_id = w.workbook_id AND s.name = o.sheet_name
+                WHERE o.value IS NOT NULL
+            ''')
+            self.cursor.execute('DROP TABLE workbooks')
+
+        self.create_workbooks_view()
+
+    def migrate_label_forms(self):
+        # Version 2: labels carry their display and print forms as stored generated columns, computed
+        # once when a row is written (by any front end, including writes through the workbooks view)
+        # instead of on every table refresh and export. Adding stored generated columns means rebuilding
+        # the table, and the view has to be dropped while labels is swapped out.
+        self.drop_workbooks_view()
+        self.cursor.execute(f'''
+            CREATE TABLE labels_new (
+                sheet_id INTEGER NOT NULL REFERENCES sheet_names (sheet_id),
+                value TEXT NOT NULL,
+                quantity INTEGER,
+                stacked INTEGER,
+                display_value TEXT GENERATED ALWAYS AS ({DISPLAY_VALUE_SQL}) STORED,
+                print_value TEXT GENERATED ALWAYS AS ({PRINT_VALUE_SQL}) STORED,
+                PRIMARY KEY (sheet_id, value)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            INSERT INTO labels_new (sheet_id, value, quantity, stacked)
+            SELECT sheet_id, value, quantity, stacked FROM labels
+        ''')
+        self.cursor.execute('DROP TABLE labels')
+        self.cursor.execute('ALTER TABLE labels_new RENAME TO labels')
+        self.create_workbooks_view()
+
+    def migrate_label_totals(self):
+        # Version 3: per-workbook label totals for purchasing reports, kept in step with labels by triggers
+        # so a report over every job reads one small row per distinct label and workbook instead of every
+        # sheet. sheets counts the label rows behind each total, so a total disappears with its last row.
+        self.cursor.execute('''
+            CREATE TABLE workbook_label_totals (
+                workbook_id INTEGER NOT NULL REFERENCES workbook_names (workbook_id),
+                value TEXT NOT NULL,
+                stacked INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                sheets INTEGER NOT NULL,
+                PRIMARY KEY (workbook_id, value, stacked)
+            ) WITHOUT ROWID
+        ''')
+        self.cursor.execute('''
+            INSERT INTO workbook_label_totals (workbook_id, value, stacked, quantity, sheets)
+            SELECT s.workbook_id, l.value, COALESCE(l.stacked, 0), SUM(COALESCE(l.quantity, 0)), COUNT(*)
+            FROM labels l JOIN sheet_names s ON s.sheet_id = l.sheet_id
+            GROUP BY s.workbook_id, l.value, COALESCE(l.stacked, 0)
+        ''')
+
+        # "WHERE true" keeps the upsert's ON CONFLICT from being parsed as part of the SELECT
+        add_row = '''
+            INSERT INTO workbook_label_totals (workbook_id, value, stacked, quantity, sheets)
+            SELECT workbook_id, NEW.value, COALESCE(NEW.stacked, 0), COALESCE(NEW.quantity, 0), 1
+            FROM sheet_names WHERE sheet_id = NEW.sheet_id AND true
+            ON CONFLICT (workbook_id, value, stacked)
+            DO UPDATE SET quantity = quantity + excluded.quantity, sheets = sheets + 1;
+        '''
+        remove_row = '''
+            UPDATE workbook_label_totals
+            SET quantity = quantity - COALESCE(OLD.quantity, 0), sheets = sheets - 1
+            WHERE workbook_id = (SELECT workbook_id FROM sheet_names WHERE sheet_id = OLD.sheet_id)
+              AND value = OLD.value AND stacked = COALESCE(OLD.stacked, 0);
+            DELETE FROM workbook_label_totals
+            WHERE workbook_id = (SELECT workbook_id FROM sheet_names WHERE sheet_id = OLD.sheet_id)
+              AND value = OLD.value AND stacked = COALESCE(OLD.stacked, 0) AND sheets <= 0;
+        '''
+        self.cursor.execute(f'CREATE TRIGGER labels_totals_insert AFTER INSERT ON labels BEGIN {add_row} END')
+        self.cursor.execute(f'CREATE TRIGGER labels_totals_delete AFTER DELETE ON labels BEGIN {remove_row} END')
+        self.cursor.execute(f'''
+            CREATE TRIGGER labels_totals_update AFTER UPDATE OF sheet_id, value, quantity, stacked ON labels
+            BEGIN {remove_row} {add_row} END
+        ''')
+
+    def migrate_label_search(self):
+        # Version 4: label search across every job. label_values holds each distinct value once, with a
+        # count of the label rows using it, kept up to date by triggers on labels. A trigram FTS5 index
+        # over label_values answers substring searches without scanning labels, and labels gets an
+        # index on value to find the rows behind each match.
+        self.cursor.execute('CREATE INDEX labels_value ON labels (value)')
+        self.cursor.execute('''
+            CREATE TABLE label_values (
+                value_id INTEGER PRIMARY KEY,
+                value TEXT NOT NULL UNIQUE,
+                refs INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            INSERT INTO label_values (value, refs)
+            SELECT value, COUNT(*) FROM labels GROUP BY value ORDER BY value
+        ''')
+
+        add_value = '''
+            INSERT INTO label_values (value, refs) VALUES (NEW.value, 1)
+            ON CONFLICT (value) DO UPDATE SET refs = refs + 1;
+        '''
+        remove_value = '''
+            UPDATE label_values SET refs = refs - 1 WHERE value = OLD.value;
+            DELETE FROM label_values WHERE value = OLD.value AND refs <= 0;
+        '''
+        self.cursor.execute(f'CREATE TRIGGER labels_values_insert AFTER INSERT ON labels BEGIN {add_value} END')
+        self.cursor.execute(f'CREATE TRIGGER labels_values_delete AFTER DELETE ON labels BEGIN {remove_value} END')
+        self.cursor.execute(f'''
+            CREATE TRIGGER labels_values_update AFTER UPDATE OF value ON labels
+            BEGIN {remove_value} {add_value} END
+        ''')
+
+        # The trigram tokenizer needs SQLite 3.34+ built with FTS5; without it searches fall back to LIKE
         try:
             self.cursor.execute('''
-                INSERT OR IGNORE INTO workbooks (workbook_name, sheet_name, value, quantity, stacked)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (workbook_name, sheet_name, value, quantity, stacked))
-            self.conn.commit()
+                CREATE VIRTUAL TABLE label_search USING fts5(
+                    value, content = 'label_values', content_rowid = 'value_id', tokenize = 'trigram'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logging.warning('Label search index unavailable, searches will scan label values: %s', e)
+            return
+        self.cursor.execute("INSERT INTO label_search (label_search) VALUES ('rebuild')")
+        # label_values rows are only ever inserted or deleted (refs changes don't touch the text)
+        self.cursor.execute('''
+            CREATE TRIGGER label_values_search_insert AFTER INSERT ON label_values
+            BEGIN
+                INSERT INTO label_search (rowid, value) VALUES (NEW.value_id, NEW.value);
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER label_values_search_delete AFTER DELETE ON label_values
+            BEGIN
+                INSERT INTO label_search (label_search, rowid, value) VALUES ('delete', OLD.value_id, OLD.value);
+            END
+        ''')
+
+    def migrate_change_journal(self):
+        # Version 5: an append-only journal of label changes for undo/redo. Each write method records its
+        # changes as one change set: a row per label inserted, updated or deleted holding the old and new
+        # (value, quantity, stacked), written by triggers while journal_state names the open change set.
+        # Sheets are logged by id with their names kept in journal_sheets, so sheet ids must never be
+        # reused: sheet_names is rebuilt with AUTOINCREMENT (ids are kept, labels still point at them).
+        self.drop_workbooks_view()
+        self.cursor.execute('''
+            CREATE TABLE sheet_names_new (
+                sheet_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                workbook_id INTEGER NOT NULL REFERENCES workbook_names (workbook_id),
+                name TEXT NOT NULL,
+                UNIQUE (workbook_id, name)
+            )
+        ''')
+        self.cursor.execute('INSERT INTO sheet_names_new (sheet_id, workbook_id, name) SELECT sheet_id, workbook_id, name FROM sheet_names')
+        self.cursor.execute('DROP TABLE sheet_names')
+        # The label triggers name sheet_names; legacy mode renames without re-checking them against the
+        # dropped table, and they pick up the new table under the same name
+        self.cursor.execute('PRAGMA legacy_alter_table = ON')
+        self.cursor.execute('ALTER TABLE sheet_names_new RENAME TO sheet_names')
+        self.cursor.execute('PRAGMA legacy_alter_table = OFF')
+        self.create_workbooks_view()
+
+        self.cursor.execute('''
+            CREATE TABLE journal_sheets (
+                sheet_id INTEGER PRIMARY KEY,
+                workbook_name TEXT NOT NULL,
+                sheet_name TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            INSERT INTO journal_sheets (sheet_id, workbook_name, sheet_name)
+            SELECT s.sheet_id, w.name, s.name FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER sheet_names_journal AFTER INSERT ON sheet_names
+            BEGIN
+                INSERT OR REPLACE INTO journal_sheets (sheet_id, workbook_name, sheet_name)
+                SELECT NEW.sheet_id, name, NEW.name FROM workbook_names WHERE workbook_id = NEW.workbook_id;
+            END
+        ''')
+
+        self.cursor.execute('''
+            CREATE TABLE change_sets (
+                change_set_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                description TEXT NOT NULL,
+                created REAL NOT NULL,
+                undone INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE change_log (
+                change_id INTEGER PRIMARY KEY,
+                change_set_id INTEGER NOT NULL REFERENCES change_sets (change_set_id),
+                sheet_id INTEGER NOT NULL,
+                old_value TEXT, old_quantity INTEGER, old_stacked INTEGER,
+                new_value TEXT, new_quantity INTEGER, new_stacked INTEGER
+            )
+        ''')
+        self.cursor.execute('CREATE INDEX change_log_set ON change_log (change_set_id)')
+        self.cursor.execute('CREATE TABLE journal_state (change_set_id INTEGER)')
+        self.cursor.execute('INSERT INTO journal_state (change_set_id) VALUES (NULL)')
+
+        recording = '(SELECT change_set_id FROM journal_state) IS NOT NULL'
+        self.cursor.execute(f'''
+            CREATE TRIGGER labels_journal_insert AFTER INSERT ON labels WHEN {recording}
+            BEGIN
+                INSERT INTO change_log (change_set_id, sheet_id, new_value, new_quantity, new_stacked)
+                VALUES ((SELECT change_set_id FROM journal_state), NEW.sheet_id, NEW.value, NEW.quantity, NEW.stacked);
+            END
+        ''')
+        self.cursor.execute(f'''
+            CREATE TRIGGER labels_journal_delete AFTER DELETE ON labels WHEN {recording}
+            BEGIN
+                INSERT INTO change_log (change_set_id, sheet_id, old_value, old_quantity, old_stacked)
+                VALUES ((SELECT change_set_id FROM journal_state), OLD.sheet_id, OLD.value, OLD.quantity, OLD.stacked);
+            END
+        ''')
+        # Rows never move between sheets; updates that change nothing aren't logged
+        self.cursor.execute(f'''
+            CREATE TRIGGER labels_journal_update AFTER UPDATE ON labels
+            WHEN {recording} AND OLD.sheet_id = NEW.sheet_id
+                 AND (OLD.value IS NOT NEW.value OR OLD.quantity IS NOT NEW.quantity OR OLD.stacked IS NOT NEW.stacked)
+            BEGIN
+                INSERT INTO change_log (change_set_id, sheet_id, old_value, old_quantity, old_stacked,
+                                        new_value, new_quantity, new_stacked)
+                VALUES ((SELECT change_set_id FROM journal_state), NEW.sheet_id, OLD.value, OLD.quantity, OLD.stacked,
+                        NEW.value, NEW.quantity, NEW.stacked);
+            END
+        ''')
+
+    def migrate_ingest_status(self):
+        # Version 6: what the folder watcher (pscxl_watch) has seen and imported, one row per file.
+        # state is 'pending' while a file settles, then 'importing', 'done' or 'error'; updated is a Unix time
+        # that lets the GUI ask for rows it hasn't seen yet.
+        self.cursor.execute('''
+            CREATE TABLE ingest_status (
+                file_path TEXT PRIMARY KEY,
+                workbook_name TEXT NOT NULL,
+                state TEXT NOT NULL,
+                changed_rows INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated REAL NOT NULL
+            )
+        ''')
+        self.cursor.execute('CREATE INDEX ingest_status_updated ON ingest_status (updated)')
+
+    def drop_workbooks_view(self):
+        for trigger in ('workbooks_insert', 'workbooks_update', 'workbooks_delete'):
+            self.cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        self.cursor.execute('DROP VIEW IF EXISTS workbooks')
+
+    def create_workbooks_view(self):
+        # The original single-table layout, kept as a view so older front ends and raw SQL keep working
+        self.cursor.execute('''
+            CREATE VIEW workbooks AS
+            SELECT w.name AS workbook_name, s.name AS sheet_name, l.value AS value,
+                   l.quantity AS quantity, l.stacked AS stacked
+            FROM labels l
+            JOIN sheet_names s ON s.sheet_id = l.sheet_id
+            JOIN workbook_names w ON w.workbook_id = s.workbook_id
+        ''')
+
+        # Writes through the view land in the normalized tables. The label statements carry no conflict
+        # clause, so INSERT OR IGNORE / plain INSERT on the view behave as they did on the old table.
+        # Updates through the view change value, quantity and stacked; workbook and sheet names are fixed.
+        self.cursor.execute('''
+            CREATE TRIGGER workbooks_insert INSTEAD OF INSERT ON workbooks
+            BEGIN
+                INSERT INTO workbook_names (name)
+                SELECT NEW.workbook_name
+                WHERE NOT EXISTS (SELECT 1 FROM workbook_names WHERE name = NEW.workbook_name);
+                INSERT INTO sheet_names (workbook_id, name)
+                SELECT w.workbook_id, NEW.sheet_name FROM workbook_names w
+                WHERE w.name = NEW.workbook_name
+                  AND NOT EXISTS (SELECT 1 FROM sheet_names s WHERE s.workbook_id = w.workbook_id AND s.name = NEW.sheet_name);
+                INSERT INTO labels (sheet_id, value, quantity, stacked)
+                SELECT s.sheet_id, NEW.value, NEW.quantity, NEW.stacked
+                FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+                WHERE w.name = NEW.workbook_name AND s.name = NEW.sheet_name;
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER workbooks_update INSTEAD OF UPDATE ON workbooks
+            BEGIN
+                UPDATE labels SET value = NEW.value, quantity = NEW.quantity, stacked = NEW.stacked
+                WHERE value = OLD.value AND sheet_id = (
+                    SELECT s.sheet_id FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+                    WHERE w.name = OLD.workbook_name AND s.name = OLD.sheet_name
+                );
+            END
+        ''')
+        self.cursor.execute('''
+            CREATE TRIGGER workbooks_delete INSTEAD OF DELETE ON workbooks
+            BEGIN
+                DELETE FROM labels WHERE value = OLD.value AND sheet_id = (
+                    SELECT s.sheet_id FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+                    WHERE w.name = OLD.workbook_name AND s.name = OLD.sheet_name
+                );
+                DELETE FROM sheet_names
+                WHERE name = OLD.sheet_name
+                  AND workbook_id = (SELECT workbook_id FROM workbook_names WHERE name = OLD.workbook_name)
+                  AND NOT EXISTS (SELECT 1 FROM labels l WHERE l.sheet_id = sheet_names.sheet_id);
+                DELETE FROM workbook_names
+                WHERE name = OLD.workbook_name
+                  AND NOT EXISTS (SELECT 1 FROM sheet_names s WHERE s.workbook_id = workbook_names.workbook_id);
+            END
+        ''')
+
+    def get_sheet_id(self, workbook_name, sheet_name, create=False):
+        self.cursor.execute(SHEET_ID_SQL, (workbook_name, sheet_name))
+        row = self.cursor.fetchone()
+        if row:
+            return row[0]
+        if not create:
+            return None
+
+        # Runs inside the caller's transaction
+        self.cursor.execute('INSERT OR IGNORE INTO workbook_names (name) VALUES (?)', (workbook_name,))
+        self.cursor.execute('SELECT workbook_id FROM workbook_names WHERE name = ?', (workbook_name,))
+        workbook_id = self.cursor.fetchone()[0]
+        self.cursor.execute('INSERT INTO sheet_names (workbook_id, name) VALUES (?, ?)', (workbook_id, sheet_name))
+        return self.cursor.lastrowid
+
+    def prune_names(self):
+        # Drop sheet and workbook names that no longer have any labels, so they disappear from the selectors.
+        # Runs inside the caller's transaction.
+        self.cursor.execute('''
+            DELETE FROM sheet_names
+            WHERE NOT EXISTS (SELECT 1 FROM labels l WHERE l.sheet_id = sheet_names.sheet_id)
+        ''')
+        self.cursor.execute('''
+            DELETE FROM workbook_names
+            WHERE NOT EXISTS (SELECT 1 FROM sheet_names s WHERE s.workbook_id = workbook_names.workbook_id)
+        ''')
+
+    def begin_change_set(self, description):
+        # Runs inside the caller's transaction: label changes until end_change_set() become one undo step
+        if self.journal_limit <= 0:
+            return
+        self.cursor.execute('INSERT INTO change_sets (description, created) VALUES (?, ?)', (description, time.time()))
+        self.cursor.execute('UPDATE journal_state SET change_set_id = ?', (self.cursor.lastrowid,))
+
+    def end_change_set(self):
+        # Runs inside the caller's transaction. A step that changed nothing isn't kept; a step that did
+        # drops anything undone and not redone, and the oldest steps past the limit.
+        if self.journal_limit <= 0:
+            return
+        self.cursor.execute('''
+            DELETE FROM change_sets
+            WHERE change_set_id = (SELECT change_set_id FROM journal_state)
+              AND NOT EXISTS (SELECT 1 FROM change_log WHERE change_set_id = change_sets.change_set_id)
+        ''')
+        kept = not self.cursor.rowcount
+        self.cursor.execute('UPDATE journal_state SET change_set_id = NULL')
+        if not kept:
+            return
+        self.cursor.execute('''
+            DELETE FROM change_log WHERE change_set_id IN (SELECT change_set_id FROM change_sets WHERE undone)
+        ''')
+        self.cursor.execute('DELETE FROM change_sets WHERE undone')
+        self.cursor.execute('SELECT change_set_id FROM change_sets ORDER BY change_set_id DESC LIMIT 1 OFFSET ?',
+                            (self.journal_limit - 1,))
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.cursor.execute('DELETE FROM change_log WHERE change_set_id < ?', row)
+            self.cursor.execute('DELETE FROM change_sets WHERE change_set_id < ?', row)
+
+    def replay_change_set(self, change_set_id, undo):
+        # Runs inside the caller's transaction, with no change set open so the replay itself isn't logged.
+        # Undo applies the changes backwards from new to old; redo applies them forwards again.
+        self.cursor.execute(f'''
+            SELECT j.workbook_name, j.sheet_name, c.old_value, c.old_quantity, c.old_stacked,
+                   c.new_value, c.new_quantity, c.new_stacked
+            FROM change_log c JOIN journal_sheets j ON j.sheet_id = c.sheet_id
+            WHERE c.change_set_id = ?
+            ORDER BY c.change_id {'DESC' if undo else 'ASC'}
+        ''', (change_set_id,))
+        sheet_ids = {}
+        statements = []  # Runs of the same statement, executed with executemany in log order
+        for workbook_name, sheet_name, *row in self.cursor.fetchall():
+            before, after = (row[3:], row[:3]) if undo else (row[:3], row[3:])
+            if (workbook_name, sheet_name) not in sheet_ids:
+                sheet_ids[(workbook_name, sheet_name)] = self.get_sheet_id(workbook_name, sheet_name, create=True)
+            sheet_id = sheet_ids[(workbook_name, sheet_name)]
+            if before[0] is None:
+                statement = 'INSERT INTO labels (sheet_id, value, quantity, stacked) VALUES (?, ?, ?, ?)'
+                params = (sheet_id,) + tuple(after)
+            elif after[0] is None:
+                statement = 'DELETE FROM labels WHERE sheet_id = ? AND value = ?'
+                params = (sheet_id, before[0])
+            else:
+                statement = 'UPDATE labels SET value = ?, quantity = ?, stacked = ? WHERE sheet_id = ? AND value = ?'
+                params = tuple(after) + (sheet_id, before[0])
+            if statements and statements[-1][0] == statement:
+                statements[-1][1].append(params)
+            else:
+                statements.append((statement, [params]))
+        for statement, params in statements:
+            self.cursor.executemany(statement, params)
+
+        self.prune_names()
+        # The stored rows no longer match the files, so the next import of these workbooks re-reads them
+        for workbook_name in {workbook_name for workbook_name, _ in sheet_ids}:
+            self.delete_fingerprints(workbook_name)
+
+    def undo(self):
+        # Reverts the latest change set; returns its description, or None when there is nothing to undo
+        return self.step_history(undo=True)
+
+    def redo(self):
+        # Re-applies the change set undone last; returns its description, or None when there is nothing to redo
+        return self.step_history(undo=False)
+
+    def step_history(self, undo):
+        try:
+            with self.conn:
+                self.cursor.execute(f'''
+                    SELECT change_set_id, description FROM change_sets WHERE undone = ?
+                    ORDER BY change_set_id {'DESC' if undo else 'ASC'} LIMIT 1
+                ''', (0 if undo else 1,))
+                row = self.cursor.fetchone()
+                if row is None:
+                    return None
+                change_set_id, description = row
+                self.replay_change_set(change_set_id, undo)
+                self.cursor.execute('UPDATE change_sets SET undone = ? WHERE change_set_id = ?',
+                                    (1 if undo else 0, change_set_id))
+            return description
+        except sqlite3.Error as e:
+            logging.error(f"Error replaying change journal: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
+
+    def fetch_history(self, limit=20):
+        # Most recent change sets first: (change_set_id, description, created, undone, changes)
+        self.cursor.execute('''
+            SELECT s.change_set_id, s.description, s.created, s.undone,
+                   (SELECT COUNT(*) FROM change_log c WHERE c.change_set_id = s.change_set_id)
+            FROM change_sets s
+            ORDER BY s.change_set_id DESC
+            LIMIT ?
+        ''', (limit,))
+        return self.cursor.fetchall()
+
+    def delete_workbook_labels(self, workbook_name):
+        # Runs inside the caller's transaction
+        self.cursor.execute('''
+            DELETE FROM labels WHERE sheet_id IN (
+                SELECT s.sheet_id FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+                WHERE w.name = ?
+            )
+        ''', (workbook_name,))
+
+    def insert_data(self, workbook_name, sheet_name, value, quantity, stacked):
+        # Every write runs under "with self.conn" so a failure rolls back and releases the write lock
+        # (and the open change set) instead of holding them until the next commit
+        try:
+            with self.conn:
+                self.begin_change_set(f"Add {value} to {workbook_name}/{sheet_name}")
+                sheet_id = self.get_sheet_id(workbook_name, sheet_name, create=True)
+                self.cursor.execute('''
+                    INSERT OR IGNORE INTO labels (sheet_id, value, quantity, stacked)
+                    VALUES (?, ?, ?, ?)
+                ''', (sheet_id, value, quantity, stacked))
+                self.delete_fingerprints(workbook_name)
+                self.end_change_set()
         except sqlite3.IntegrityError as e:
             logging.error(f"Error inserting data: {e}")
+        except sqlite3.Error as e:
+            logging.error(f"Error inserting data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
+
+    def insert_many(self, rows):
+        # rows are (workbook_name, sheet_name, value, quantity, stacked) tuples, written in one transaction
+        try:
+            with self.conn:
+                rows = list(rows)
+                self.begin_change_set("Add labels")
+                self.insert_label_rows(rows)
+                for workbook_name in {row[0] for row in rows}:
+                    self.delete_fingerprints(workbook_name)
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error inserting data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
+
+    def insert_label_rows(self, rows):
+        # Runs inside the caller's transaction
+        sheet_ids = {}
+        label_rows = []
+        for workbook_name, sheet_name, value, quantity, stacked in rows:
+            key = (workbook_name, sheet_name)
+            if key not in sheet_ids:
+                sheet_ids[key] = self.get_sheet_id(workbook_name, sheet_name, create=True)
+            label_rows.append((sheet_ids[key], value, quantity, stacked))
+        self.cursor.executemany('''
+            INSERT OR IGNORE INTO labels (sheet_id, value, quantity, stacked)
+            VALUES (?, ?, ?, ?)
+        ''', label_rows)
+
+    def replace_all(self, rows):
+        # Swap every label for rows in one transaction, e.g. to restore a snapshot; undo reverts it as one step.
+        # Fingerprints are dropped with the old rows, so the next import re-reads every file.
+        try:
+            with self.conn:
+                self.begin_change_set("Restore snapshot")
+                self.cursor.execute('DELETE FROM labels')
+                self.cursor.execute('DELETE FROM workbook_fingerprints')
+                self.cursor.execute('DELETE FROM sheet_fingerprints')
+                self.insert_label_rows(rows)
+                self.prune_names()
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error restoring data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
 
     def clear_workbook_data(self, workbook_name):
         try:
-            self.cursor.execute('''
-                DELETE FROM workbooks WHERE workbook_name = ?
-            ''', (workbook_name,))
-            self.conn.commit()
+            with self.conn:
+                self.begin_change_set(f"Clear {workbook_name}")
+                self.delete_workbook_labels(workbook_name)
+                self.delete_fingerprints(workbook_name)
+                self.prune_names()
+                self.end_change_set()
         except sqlite3.Error as e:
             logging.error(f"Error clearing data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
 
-    def update_data(self, workbook_name, sheet_name, value, new_value, new_quantity, new_stacked):
+    def delete_fingerprints(self, workbook_name):
+        # Runs inside the caller's transaction. Every write that leaves a workbook's rows different from its
+        # file calls this, so the next import of the file reads it again instead of skipping it as unchanged.
+        self.cursor.execute('DELETE FROM workbook_fingerprints WHERE workbook_name = ?', (workbook_name,))
+        self.cursor.execute('DELETE FROM sheet_fingerprints WHERE workbook_name = ?', (workbook_name,))
+
+    def fetch_file_fingerprint(self, workbook_name):
+        self.cursor.execute('SELECT file_size, file_mtime FROM workbook_fingerprints WHERE workbook_name = ?',
+                            (workbook_name,))
+        return self.cursor.fetchone()
+
+    def fetch_sheet_fingerprints(self, workbook_name):
+        self.cursor.execute('SELECT sheet_name, fingerprint FROM sheet_fingerprints WHERE workbook_name = ?',
+                            (workbook_name,))
+        return dict(self.cursor.fetchall())
+
+    def set_ingest_status(self, rows):
+        # rows are (file_path, workbook_name, state, changed_rows, error)
+        updated = time.time()
+        try:
+            with self.conn:
+                self.cursor.executemany('''
+                    INSERT OR REPLACE INTO ingest_status (file_path, workbook_name, state, changed_rows, error, updated)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [tuple(row) + (updated,) for row in rows])
+        except sqlite3.Error as e:
+            logging.error(f"Error updating ingest status: {e}")
+            raise
+
+    def delete_ingest_status(self, file_paths):
+        try:
+            with self.conn:
+                self.cursor.executemany('DELETE FROM ingest_status WHERE file_path = ?',
+                                        [(file_path,) for file_path in file_paths])
+        except sqlite3.Error as e:
+            logging.error(f"Error updating ingest status: {e}")
+            raise
+
+    def fetch_ingest_status(self, since=None):
+        # Rows changed after the Unix time since (all rows when None), newest first:
+        # (file_path, workbook_name, state, changed_rows, error, updated)
         self.cursor.execute('''
-            UPDATE workbooks
-            SET value = ?, quantity = ?, stacked = ?
-            WHERE workbook_name = ? AND sheet_name = ? AND value = ?
-        ''', (new_value, new_quantity, new_stacked, workbook_name, sheet_name, value))
-        self.conn.commit()
+            SELECT file_path, workbook_name, state, changed_rows, error, updated
+            FROM ingest_status
+            WHERE updated > ?
+            ORDER BY updated DESC
+        ''', (since if since is not None else -1,))
+        return self.cursor.fetchall()
+
+    def update_workbook_sheets(self, workbook_name, sheet_names, changed_rows, sheet_fingerprints, file_fingerprint):
+        # Apply an incremental import in one transaction.
+        # sheet_names: every sheet currently in the workbook; rows of sheets that disappeared are dropped
+        # changed_rows: {sheet_name: {value: (quantity, stacked)}} for the sheets that were re-parsed;
+        #               only labels whose quantity or stacked flag differ from the stored rows are written
+        # Returns the number of label rows inserted, updated or deleted.
+        changes = 0
+        try:
+            with self.conn:
+                self.begin_change_set(f"Import {workbook_name}")
+                for sheet_name in self.fetch_sheets(workbook_name):
+                    if sheet_name not in sheet_names:
+                        self.cursor.execute('DELETE FROM labels WHERE sheet_id = ?',
+                                            (self.get_sheet_id(workbook_name, sheet_name),))
+                        changes += self.cursor.rowcount
+
+                for sheet_name, new_rows in changed_rows.items():
+                    sheet_id = self.get_sheet_id(workbook_name, sheet_name, create=True)
+                    self.cursor.execute('SELECT value, quantity, stacked FROM labels WHERE sheet_id = ?', (sheet_id,))
+                    old_rows = {value: (quantity, stacked) for value, quantity, stacked in self.cursor.fetchall()}
+                    deleted = [(sheet_id, value) for value in old_rows if value not in new_rows]
+                    updated = [(quantity, stacked, sheet_id, value)
+                               for value, (quantity, stacked) in new_rows.items()
+                               if value in old_rows and old_rows[value] != (quantity, stacked)]
+                    inserted = [(sheet_id, value, quantity, stacked)
+                                for value, (quantity, stacked) in new_rows.items() if value not in old_rows]
+                    self.cursor.executemany('DELETE FROM labels WHERE sheet_id = ? AND value = ?', deleted)
+                    self.cursor.executemany('''
+                        UPDATE labels SET quantity = ?, stacked = ?
+                        WHERE sheet_id = ? AND value = ?
+                    ''', updated)
+                    self.cursor.executemany('''
+                        INSERT INTO labels (sheet_id, value, quantity, stacked)
+                        VALUES (?, ?, ?, ?)
+                    ''', inserted)
+                    changes += len(deleted) + len(updated) + len(inserted)
+
+                self.prune_names()
+                self.delete_fingerprints(workbook_name)
+                self.cursor.executemany('''
+                    INSERT INTO sheet_fingerprints (workbook_name, sheet_name, fingerprint) VALUES (?, ?, ?)
+                ''', [(workbook_name, sheet_name, fingerprint)
+                      for sheet_name, fingerprint in sheet_fingerprints.items() if fingerprint is not None])
+                self.cursor.execute('''
+                    INSERT INTO workbook_fingerprints (workbook_name, file_size, file_mtime) VALUES (?, ?, ?)
+                ''', (workbook_name,) + tuple(file_fingerprint))
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error updating workbook data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
+        return changes
+
+    def update_data(self, workbook_name, sheet_name, value, new_value, new_quantity, new_stacked):
+        # Raises sqlite3.IntegrityError, with nothing changed, if new_value is already on the sheet
+        try:
+            with self.conn:
+                self.begin_change_set(f"Edit {value} in {workbook_name}/{sheet_name}")
+                self.cursor.execute(f'''
+                    UPDATE labels
+                    SET value = ?, quantity = ?, stacked = ?
+                    WHERE sheet_id = ({SHEET_ID_SQL}) AND value = ?
+                ''', (new_value, new_quantity, new_stacked, workbook_name, sheet_name, value))
+                self.delete_fingerprints(workbook_name)
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error updating data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
 
     def delete_data(self, workbook_name, sheet_name, value):
-        self.cursor.execute('''
-            DELETE FROM workbooks
-            WHERE workbook_name = ? AND sheet_name = ? AND value = ?
-        ''', (workbook_name, sheet_name, value))
-        self.conn.commit()
+        try:
+            with self.conn:
+                self.begin_change_set(f"Delete {value} from {workbook_name}/{sheet_name}")
+                self.cursor.execute(f'''
+                    DELETE FROM labels
+                    WHERE sheet_id = ({SHEET_ID_SQL}) AND value = ?
+                ''', (workbook_name, sheet_name, value))
+                self.prune_names()
+                self.delete_fingerprints(workbook_name)
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
+
+    def update_many(self, rows):
+        # Bulk edit in one transaction: rows are (workbook_name, sheet_name, value, new_value, new_quantity,
+        # new_stacked) tuples. If any row can't be written (e.g. a new value already exists on that sheet)
+        # nothing is changed and the error is raised.
+        try:
+            with self.conn:
+                rows = list(rows)
+                self.begin_change_set(f"Edit {len(rows)} labels")
+                self.cursor.executemany(f'''
+                    UPDATE labels
+                    SET value = ?, quantity = ?, stacked = ?
+                    WHERE sheet_id = ({SHEET_ID_SQL}) AND value = ?
+                ''', [(new_value, new_quantity, new_stacked, workbook_name, sheet_name, value)
+                      for workbook_name, sheet_name, value, new_value, new_quantity, new_stacked in rows])
+                for workbook_name in {row[0] for row in rows}:
+                    self.delete_fingerprints(workbook_name)
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error updating data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
+
+    def delete_many(self, keys):
+        # keys are (workbook_name, sheet_name, value) tuples, deleted in one transaction
+        try:
+            with self.conn:
+                keys = list(keys)
+                self.begin_change_set(f"Delete {len(keys)} labels")
+                self.cursor.executemany(f'''
+                    DELETE FROM labels
+                    WHERE sheet_id = ({SHEET_ID_SQL}) AND value = ?
+                ''', keys)
+                self.prune_names()
+                for workbook_name in {key[0] for key in keys}:
+                    self.delete_fingerprints(workbook_name)
+                self.end_change_set()
+        except sqlite3.Error as e:
+            logging.error(f"Error deleting data: {e}")
+            raise
+        finally:
+            self.invalidate_cache()
 
     def fetch_workbooks(self):
-        self.cursor.execute('SELECT DISTINCT workbook_name FROM workbooks')
+        return self.cached(('workbooks',), self.query_workbooks)
+
+    def query_workbooks(self):
+        self.cursor.execute('SELECT name FROM workbook_names ORDER BY name')
         return [row[0] for row in self.cursor.fetchall()]
 
     def fetch_sheets(self, workbook_name):
-        self.cursor.execute('SELECT DISTINCT sheet_name FROM workbooks WHERE workbook_name = ?', (workbook_name,))
+        return self.cached(('sheets', workbook_name), lambda: self.query_sheets(workbook_name))
+
+    def query_sheets(self, workbook_name):
+        self.cursor.execute('''
+            SELECT s.name FROM sheet_names s JOIN workbook_names w ON w.workbook_id = s.workbook_id
+            WHERE w.name = ?
+            ORDER BY s.name
+        ''', (workbook_name,))
         return [row[0] for row in self.cursor.fetchall()]
 
     def fetch_data(self, workbook_name, sheet_name):
-        self.cursor.execute('SELECT value, quantity, stacked FROM workbooks WHERE workbook_name = ? AND sheet_name = ?', 
+        return self.cached(('data', workbook_name, sheet_name), lambda: self.query_data(workbook_name, sheet_name))
+
+    def query_data(self, workbook_name, sheet_name):
+        self.cursor.execute(f'SELECT value, quantity, stacked FROM labels WHERE sheet_id = ({SHEET_ID_SQL})',
                             (workbook_name, sheet_name))
         return self.cursor.fetchall()
+
+    def count_data(self, workbook_name, sheet_name):
+        return self.cached(('count', workbook_name, sheet_name), lambda: self.query_count(workbook_name, sheet_name))[0]
+
+    def query_count(self, workbook_name, sheet_name):
+        self.cursor.execute(f'SELECT COUNT(*) FROM labels WHERE sheet_id = ({SHEET_ID_SQL})',
+                            (workbook_name, sheet_name))
+        return [self.cursor.fetchone()[0]]
+
+    def fetch_data_page(self, workbook_name, sheet_name, offset, limit):
+        return self.cached(('page', workbook_name, sheet_name, offset, limit),
+                           lambda: self.query_data_page(workbook_name, sheet_name, offset, limit))
+
+    def query_data_page(self, workbook_name, sheet_name, offset, limit):
+        # One page of a sheet in primary key order, for the paged table view: (value, display_value, quantity, stacked)
+        self.cursor.execute(f'''
+            SELECT value, display_value, quantity, stacked FROM labels
+            WHERE sheet_id = ({SHEET_ID_SQL})
+            ORDER BY value
+            LIMIT ? OFFSET ?
+        ''', (workbook_name, sheet_name, limit, offset))
+        return self.cursor.fetchall()
+
+    def fetch_label_totals(self, workbook_names=None, sheet_names=None):
+        # Total quantity of each label across a selection of workbooks, optionally narrowed to sheets with
+        # the given names (e.g. only "PANEL" sheets); None selects everything. Stacked and unstacked stock
+        # are totalled separately: [(value, stacked, quantity)] ordered by value.
+        workbook_names = tuple(sorted(set(workbook_names))) if workbook_names is not None else None
+        sheet_names = tuple(sorted(set(sheet_names))) if sheet_names is not None else None
+        return self.cached(('totals', workbook_names, sheet_names),
+                           lambda: self.query_label_totals(workbook_names, sheet_names))
+
+    def query_label_totals(self, workbook_names, sheet_names):
+        conditions = []
+        params = []
+        if workbook_names is not None:
+            conditions.append(f"w.name IN ({', '.join('?' * len(workbook_names))})")
+            params.extend(workbook_names)
+        if sheet_names is None:
+            # Whole workbooks come straight from the summary table
+            source = '''
+                SELECT t.value AS value, t.stacked AS stacked, t.quantity AS quantity
+                FROM workbook_label_totals t JOIN workbook_names w ON w.workbook_id = t.workbook_id
+            '''
+        else:
+            conditions.append(f"s.name IN ({', '.join('?' * len(sheet_names))})")
+            params.extend(sheet_names)
+            source = '''
+                SELECT l.value AS value, COALESCE(l.stacked, 0) AS stacked, COALESCE(l.quantity, 0) AS quantity
+                FROM labels l
+                JOIN sheet_names s ON s.sheet_id = l.sheet_id
+                JOIN workbook_names w ON w.workbook_id = s.workbook_id
+            '''
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        self.cursor.execute(f'''
+            SELECT value, stacked, SUM(quantity) FROM ({source} {where})
+            GROUP BY value, stacked
+            ORDER BY value, stacked
+        ''', params)
+        return self.cursor.fetchall()
+
+    def has_search_index(self):
+        if self.search_index is None:
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'label_search'")
+            self.search_index = self.cursor.fetchone() is not None
+        return self.search_index
+
+    def search_labels(self, query, limit=-1):
+        # Every label row whose value contains query (case-insensitive), across all workbooks and sheets.
+        # Returns a cursor over (workbook_name, sheet_name, value, display_value, quantity, stacked) so
+        # callers can fetch results in chunks. Exact matches come first, then values starting with the
+        # query, then the rest by FTS rank (shorter values first when scanning).
+        pattern = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params = {'query': query, 'prefix': pattern + '%', 'contains': '%' + pattern + '%', 'limit': limit}
+        # Trigrams need at least three characters to match on
+        if self.has_search_index() and len(query) >= 3:
+            params['match'] = '"' + query.replace('"', '""') + '"'
+            hits = '''
+                SELECT v.value AS value, m.rank AS rank
+                FROM label_search m JOIN label_values v ON v.value_id = m.rowid
+                WHERE label_search MATCH :match
+            '''
+        else:
+            hits = '''
+                SELECT value, length(value) AS rank FROM label_values
+                WHERE value LIKE :contains ESCAPE '\\'
+            '''
+        return self.conn.execute(f'''
+            SELECT w.name, s.name, l.value, l.display_value, l.quantity, l.stacked
+            FROM ({hits}) h
+            CROSS JOIN labels l ON l.value = h.value
+            JOIN sheet_names s ON s.sheet_id = l.sheet_id
+            JOIN workbook_names w ON w.workbook_id = s.workbook_id
+            ORDER BY lower(h.value) = lower(:query) DESC, h.value LIKE :prefix ESCAPE '\\' DESC, h.rank, h.value,
+                     w.name, s.name
+            LIMIT :limit
+        ''', params)
+
+    def fetch_stats(self):
+        # Database-wide totals for reporting
+        self.cursor.execute('''
+            SELECT (SELECT COUNT(*) FROM workbook_names),
+                   (SELECT COUNT(*) FROM sheet_names),
+                   COUNT(*),
+                   COALESCE(SUM(quantity), 0)
+            FROM labels
+        ''')
+        workbooks, sheets, labels, total_quantity = self.cursor.fetchone()
+        return {'workbooks': workbooks, 'sheets': sheets, 'labels': labels, 'total_quantity': total_quantity}
+
+    def iter_labels(self):
+        # (workbook_name, sheet_name, value, quantity, stacked) in iter_all_data order
+        return (row[:5] for row in self.iter_all_data())
+
+    def iter_all_data(self):
+        # Every row grouped by workbook and sheet, read lazily from its own cursor:
+        # (workbook_name, sheet_name, value, quantity, stacked, print_value)
+        # CROSS JOIN pins the loop order so SQLite walks the name indexes and then each sheet's
+        # primary key range, already in output order, instead of sorting every label in a temp b-tree.
+        return self.conn.execute('''
+            SELECT w.name, s.name, l.value, l.quantity, l.stacked, l.print_value
+            FROM workbook_names w
+            CROSS JOIN sheet_names s ON s.workbook_id = w.workbook_id
+            CROSS JOIN labels l ON l.sheet_id = s.sheet_id
+            ORDER BY w.name, s.name, l.value
+        ''')
@@ -0,0 +1,92 @@
+import csv
+import logging
+import os
+from itertools import repeat
+import openpyxl
+from pscxl_database import PSCXL_Database
+from pscxl_timing import span
+
+# Layouts:
+#   expanded: one row per physical label, each print value repeated quantity times (what the printers take)
+#   compact: one row per distinct label with its quantity and stacked flag
+EXPORT_LAYOUTS = ('expanded', 'compact')
+EXPORT_FORMATS = ('xlsx', 'csv', 'tsv')
+
+def export_format(save_path):
+    # Pick the format from the file extension; anything unknown is written as Excel
+    extension = os.path.splitext(save_path)[1].lower().lstrip('.')
+    return extension if extension in EXPORT_FORMATS else 'xlsx'
+
+def export_data(db_name, save_path, layout='expanded', file_format=None):
+    # Returns the number of rows written (excluding headers)
+    file_format = file_format or export_format(save_path)
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid export format: {file_format}")
+    if file_format == 'xlsx':
+        return export_to_excel(db_name, save_path, layout)
+    return export_to_csv(db_name, save_path, layout, '\t' if file_format == 'tsv' else ',')
+
+def export_to_excel(db_name, save_path, layout='expanded'):
+    # Stream every label out of the database into a write-only workbook.
+    # Write-only sheets flush appended rows to disk as they go, and the rows come from a single
+    # ordered cursor, so memory stays flat no matter how many labels are exported.
+    # Returns the number of rows written (excluding headers).
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"Invalid export layout: {layout}")
+    db = PSCXL_Database(db_name)
+    try:
+        with span('export', file=save_path, layout=layout) as record:
+            new_wb = openpyxl.Workbook(write_only=True)
+            new_ws = None
+            current_sheet = None
+            row_count = 0
+            for workbook_name, sheet_name, value, quantity, stacked, print_value in db.iter_all_data():
+                # Rows arrive grouped by workbook and sheet, so a new key means a new output sheet
+                if (workbook_name, sheet_name) != current_sheet:
+                    current_sheet = (workbook_name, sheet_name)
+                    new_ws = new_wb.create_sheet(title=sheet_name)
+                    new_ws.append(['Value', 'Quantity', 'Stacked'] if layout == 'compact' else ['Value', 'Quantity'])
+
+                if layout == 'compact':
+                    new_ws.append([print_value, quantity, bool(stacked)])
+                    row_count += 1
+                else:
+                    row = [print_value]  # Already in printer form (see pscxl_labels)
+                    for _ in range(quantity):
+                        new_ws.append(row)
+                    row_count += quantity
+
+            new_wb.save(save_path)
+            record['rows'] = row_count
+        logging.debug('Exported %d rows to %s', row_count, save_path)
+        return row_count
+    finally:
+        db.close()
+
+def export_to_csv(db_name, save_path, layout='expanded', delimiter=','):
+    # Plain text export for label printers, written with the csv module instead of openpyxl.
+    # Every sheet goes into the one file, so each row starts with its workbook and sheet name.
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"Invalid export layout: {layout}")
+    db = PSCXL_Database(db_name)
+    try:
+        with span('export', file=save_path, layout=layout) as record:
+            row_count = 0
+            # utf-8-sig so Excel recognises the encoding when the file is opened there
+            with open(save_path, 'w', newline='', encoding='utf-8-sig') as file:
+                writer = csv.writer(file, delimiter=delimiter)
+                if layout == 'compact':
+                    writer.writerow(['Workbook', 'Sheet', 'Value', 'Quantity', 'Stacked'])
+                    for workbook_name, sheet_name, value, quantity, stacked, print_value in db.iter_all_data():
+                        writer.writerow([workbook_name, sheet_name, print_value, quantity, int(bool(stacked))])
+                        row_count += 1
+                else:
+                    writer.writerow(['Workbook', 'Sheet', 'Value'])
+                    for workbook_name, sheet_name, value, quantity, stacked, print_value in db.iter_all_data():
+                        writer.writerows(repeat((workbook_name, sheet_name, print_value), quantity))
+                        row_count += quantity
+            record['rows'] = row_count
+        logging.debug('Exported %d rows to %s', row_count, save_path)
+        return row_count
+    finally:
+        db.close()
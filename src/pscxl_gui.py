@@ -1,14 +1,20 @@
 import sqlite3
-from collections import defaultdict
 import tkinter as tk
-import openpyxl
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, simpledialog
 import threading
 import logging
+import queue
 from pscxl_database import PSCXL_Database
+from pscxl_table import PSCXL_VirtualTable
+import pscxl_export
+import pscxl_logging
+from pscxl_import import PSCXL_ImportWorker, PSCXL_BatchImportWorker, find_workbooks
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s', filename='pscxl_log.txt', filemode='w')
+# Search results are moved into the table this many rows at a time, between Tk events
+SEARCH_CHUNK = 500
+
+# How often to check for workbooks imported by the folder watcher (pscxl_cli watch), in milliseconds
+INGEST_POLL_MS = 3000
 
 class PSCXL_GUI:
     def __init__(self, root):
@@ -20,10 +26,38 @@ class PSCXL_GUI:
         self.new_file_button = tk.Button(root, text="New Excel File", command=self.open_file)
         self.new_file_button.pack(pady=10)
 
+        # Add a button to import every Excel file in a folder
+        self.import_folder_button = tk.Button(root, text="Import Folder", command=self.open_folder)
+        self.import_folder_button.pack(pady=10)
+
         # Add a button to create a new Excel document from the database
-        self.export_button = tk.Button(root, text="Export to Excel", command=self.export_to_excel)
+        self.export_button = tk.Button(root, text="Export to Excel / CSV", command=self.export_to_excel)
         self.export_button.pack(pady=10)
 
+        # Compact exports write one row per label with its quantity instead of repeating it
+        self.compact_export = tk.BooleanVar(value=False)
+        self.compact_export_check = tk.Checkbutton(root, text="Compact export (value, quantity, stacked)",
+                                                   variable=self.compact_export)
+        self.compact_export_check.pack()
+
+        # Add a button to cancel a running import (enabled only while importing)
+        self.cancel_button = tk.Button(root, text="Cancel Import", command=self.cancel_import, state=tk.DISABLED)
+        self.cancel_button.pack(pady=10)
+
+        # Add undo/redo for imports and edits (also Ctrl+Z / Ctrl+Y)
+        self.history_frame = tk.Frame(root)
+        self.undo_button = tk.Button(self.history_frame, text="Undo", command=self.undo)
+        self.undo_button.pack(side=tk.LEFT, padx=5)
+        self.redo_button = tk.Button(self.history_frame, text="Redo", command=self.redo)
+        self.redo_button.pack(side=tk.LEFT, padx=5)
+        self.history_frame.pack()
+        self.root.bind("<Control-z>", lambda event: self.history_shortcut(event, self.undo))
+        self.root.bind("<Control-y>", lambda event: self.history_shortcut(event, self.redo))
+
+        # Add a status line for import progress
+        self.status_label = tk.Label(root, text="")
+        self.status_label.pack()
+
         # Create a dropdown menu for workbook names (initially with a default option)
         self.workbook_selector = ttk.Combobox(root, values=["--Select--"])
         self.workbook_selector.bind("<<ComboboxSelected>>", self.update_sheet_selector)
@@ -36,8 +70,19 @@ class PSCXL_GUI:
         self.sheet_selector.current(0)
         self.sheet_selector.pack(pady=10)
 
-        # Add a Treeview widget to display the database contents
-        self.db_tree = ttk.Treeview(root)
+        # Add a search box that finds labels across every workbook and sheet
+        self.search_frame = tk.Frame(root)
+        self.search_entry = tk.Entry(self.search_frame, width=30)
+        self.search_entry.bind("<Return>", self.search_labels)
+        self.search_entry.pack(side=tk.LEFT, padx=5)
+        self.search_button = tk.Button(self.search_frame, text="Search", command=self.search_labels)
+        self.search_button.pack(side=tk.LEFT, padx=5)
+        self.search_frame.pack(pady=10)
+
+        # Add a Treeview widget to display the database contents, with a scrollbar driven by the paged table view
+        self.table_frame = tk.Frame(root)
+        self.db_tree = ttk.Treeview(self.table_frame, height=20)
+        self.db_scrollbar = ttk.Scrollbar(self.table_frame, orient=tk.VERTICAL)
 
         # Define columns for the database Treeview
         self.db_tree['columns'] = ('Workbook', 'Sheet', 'Value', 'Quantity', 'Stacked')
@@ -59,7 +104,12 @@ class PSCXL_GUI:
         self.db_tree.heading('Stacked', text='Stacked', anchor=tk.CENTER)
 
         # Pack Treeview widget
-        self.db_tree.pack(pady=20)
+        self.db_tree.pack(side=tk.LEFT)
+        self.db_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.table_frame.pack(pady=20)
+
+        # Only the visible rows are ever inserted into the Treeview
+        self.table = PSCXL_VirtualTable(self.db_tree, self.db_scrollbar)
 
         # Bind right-click menu to Treeview
         self.db_tree.bind("<Button-3>", self.show_context_menu)
@@ -68,6 +118,12 @@ class PSCXL_GUI:
         self.context_menu = tk.Menu(root, tearoff=0)
         self.context_menu.add_command(label="Edit Row", command=self.edit_row)
         self.context_menu.add_command(label="Add Row", command=self.add_row)
+        self.context_menu.add_separator()
+        # Bulk actions apply to every selected row (Ctrl+A selects the whole sheet or search result)
+        self.context_menu.add_command(label="Set Quantity...", command=self.set_selected_quantity)
+        self.context_menu.add_command(label="Toggle Stacked", command=self.toggle_selected_stacked)
+        self.context_menu.add_command(label="Find/Replace in Values...", command=self.replace_in_selected)
+        self.context_menu.add_command(label="Delete Rows", command=self.delete_selected)
 
         # Initialize SQLite database
         self.db = PSCXL_Database()
@@ -75,16 +131,37 @@ class PSCXL_GUI:
         # Initialize SQLite database cursor
         self.cursor = self.db.cursor
 
+        # Background import worker and the queue it reports through
+        self.import_worker = None
+        self.import_queue = queue.Queue()
+        self.export_queue = queue.Queue()
+
+        # Current search: results stream from search_cursor into search_results
+        self.search_query = None
+        self.search_cursor = None
+        self.search_results = []
+        self.search_generation = 0
+
         # Read the database to populate the workbook selector
         self.read_database()
 
+        # Only watcher updates made after the window opened are reported
+        self.ingest_seen = max((row[5] for row in self.db.fetch_ingest_status()), default=None)
+        self.root.after(INGEST_POLL_MS, self.poll_ingest_status)
+
     def disable_buttons(self):
         self.new_file_button.config(state=tk.DISABLED)
+        self.import_folder_button.config(state=tk.DISABLED)
         self.export_button.config(state=tk.DISABLED)
+        self.undo_button.config(state=tk.DISABLED)
+        self.redo_button.config(state=tk.DISABLED)
 
     def enable_buttons(self):
         self.new_file_button.config(state=tk.NORMAL)
+        self.import_folder_button.config(state=tk.NORMAL)
         self.export_button.config(state=tk.NORMAL)
+        self.undo_button.config(state=tk.NORMAL)
+        self.redo_button.config(state=tk.NORMAL)
 
     def open_file(self):
         logging.debug('open_file called')
@@ -94,47 +171,141 @@ class PSCXL_GUI:
             filetypes=(("Excel files", "*.xlsx"), ("All files", "*.*"))
         )
         if file_path:
-            logging.debug(f'Selected file: {file_path}')
+            logging.debug('Selected file: %s', file_path)
             self.workbook_name = file_path
-            self.wb = openpyxl.load_workbook(self.workbook_name)
-            self.sheet_names = self.wb.sheetnames
-
-            # Store data for all sheets in the database
-            workbook_base_name = self.workbook_name.split('/')[-1].split('.')[0]
-
-            # Clear existing data for this workbook in the database
-            self.db.clear_workbook_data(workbook_base_name)
-
-            for sheet_name in self.sheet_names:
-                sheet = self.wb[sheet_name]
-                sheet_data = self.read_sheet(sheet)
-                duplicate_counts = self.count_duplicates(sheet_data)
-                for value, count in duplicate_counts.items():
-                    # Normalize the value
-                    normalized_value = str(value).strip()
-                    # Check if value is a string before checking for spaces
-                    if isinstance(value, str) and " " in normalized_value:
-                        stacked = 1  # Assume values with spaces are stacked
-                    else:
-                        stacked = 0
-                    self.db.insert_data(workbook_base_name, sheet_name, normalized_value, count, stacked)
+
+            # Parse and store the workbook on a worker thread so the window stays responsive
+            self.disable_buttons()
+            self.cancel_button.config(state=tk.NORMAL)
+            self.import_worker = PSCXL_ImportWorker(self.workbook_name, self.db.db_name, self.import_queue)
+            self.status_label.config(text=f"Importing {self.import_worker.workbook_name}...")
+            self.import_worker.start()
+            self.root.after(100, self.poll_import_queue)
+
+    def open_folder(self):
+        logging.debug('open_folder called')
+        # Open a dialog to select a folder of Excel files
+        folder = filedialog.askdirectory(title="Select Folder of Excel Files")
+        if folder:
+            file_paths = find_workbooks(folder)
+            logging.debug('Selected folder: %s (%d workbooks)', folder, len(file_paths))
+            if not file_paths:
+                messagebox.showinfo("Info", "No Excel files found in the selected folder.")
+                return
+
+            # Parse the workbooks in parallel worker processes
+            self.disable_buttons()
+            self.cancel_button.config(state=tk.NORMAL)
+            self.import_worker = PSCXL_BatchImportWorker(file_paths, self.db.db_name, self.import_queue)
+            self.status_label.config(text=f"Importing {self.import_worker.workbook_name}...")
+            self.import_worker.start()
+            self.root.after(100, self.poll_import_queue)
+
+    def cancel_import(self):
+        logging.debug('cancel_import called')
+        if self.import_worker:
+            self.import_worker.cancel()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status_label.config(text="Cancelling import...")
+
+    def poll_import_queue(self):
+        # Drain worker messages on the Tk thread
+        finished = False
+        while True:
+            try:
+                message = self.import_queue.get_nowait()
+            except queue.Empty:
+                break
+            kind, workbook_name = message[0], message[1]
+            if kind == 'progress':
+                sheet_name, index, total = message[2:]
+                if sheet_name is None:
+                    self.status_label.config(text=f"Imported {workbook_name} ({index}/{total} workbooks)")
+                else:
+                    self.status_label.config(text=f"Importing {workbook_name}: sheet {index}/{total} ({sheet_name})")
+            elif kind == 'done':
+                self.status_label.config(text=f"Imported {workbook_name} ({message[2]} labels changed)")
+                finished = True
+            elif kind == 'cancelled':
+                self.status_label.config(text=f"Import of {workbook_name} cancelled")
+                finished = True
+            elif kind == 'error':
+                self.status_label.config(text=f"Import of {workbook_name} failed")
+                messagebox.showerror("Error", f"Failed to import {workbook_name}: {message[2]}")
+                finished = True
+
+        if finished:
+            self.import_worker = None
+            self.cancel_button.config(state=tk.DISABLED)
+            self.enable_buttons()
             self.read_database()
+        else:
+            self.root.after(100, self.poll_import_queue)
+
+    def history_shortcut(self, event, step):
+        # Ctrl+Z / Ctrl+Y in a text field (the search box, the combobox) edit the text, not the database
+        if isinstance(event.widget, (tk.Entry, ttk.Entry)):
+            return
+        step()
 
-    def read_sheet(self, sheet):
-        logging.debug(f'Reading sheet: {sheet.title}')
-        data = []
-        for row in sheet.iter_rows(values_only=True):  # Read all rows
-            data.append(list(row))  # Convert each row to a list and append to data
-        return data
-
-    def count_duplicates(self, data):
-        logging.debug('Counting duplicates')
-        counter = defaultdict(int)
-        for row in data:
-            for value in row:
-                if value is not None:  # Skip empty cells
-                    counter[value] += 1
-        return counter
+    def undo(self, event=None):
+        self.step_history(self.db.undo, "Undo")
+
+    def redo(self, event=None):
+        self.step_history(self.db.redo, "Redo")
+
+    def step_history(self, step, action):
+        if self.import_worker is not None:
+            return  # The shortcuts stay bound while an import is writing
+        try:
+            description = step()
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"{action} failed: {e}")
+            return
+        if description is None:
+            self.status_label.config(text=f"Nothing to {action.lower()}")
+            return
+        logging.debug('%s: %s', action, description)
+        self.status_label.config(text=f"{action}: {description}")
+        self.reload_view()
+
+    def reload_view(self):
+        # Workbooks and sheets may have appeared or gone; keep the current selection if it still exists
+        selected_workbook = self.workbook_selector.get()
+        selected_sheet = self.sheet_selector.get()
+        search_query = self.search_query
+        self.read_database()
+        if selected_workbook in self.workbook_selector['values']:
+            self.workbook_selector.set(selected_workbook)
+            self.update_sheet_selector()
+            if selected_sheet in self.sheet_selector['values']:
+                self.sheet_selector.set(selected_sheet)
+                self.update_table()
+        if search_query is not None:
+            self.start_search(search_query)
+
+    def poll_ingest_status(self):
+        # Show jobs the folder watcher imported without restarting. Left for later while an import
+        # started here is running; that import re-reads the database when it finishes anyway.
+        if self.import_worker is None:
+            try:
+                rows = self.db.fetch_ingest_status(self.ingest_seen)
+            except sqlite3.Error as e:
+                logging.error(f"Error reading ingest status: {e}")
+                rows = []
+            if rows:
+                self.ingest_seen = rows[0][5]
+                imported = [workbook_name for _, workbook_name, state, changed_rows, _, _ in rows
+                            if state == 'done' and changed_rows]
+                failed = [workbook_name for _, workbook_name, state, _, _, _ in rows if state == 'error']
+                if imported:
+                    self.status_label.config(text=f"Auto-imported {', '.join(imported)}")
+                    self.reload_view()
+                elif failed:
+                    self.status_label.config(text=f"Auto-import of {', '.join(failed)} failed")
+                elif rows[0][2] == 'importing':
+                    self.status_label.config(text=f"Auto-importing {rows[0][1]}...")
+        self.root.after(INGEST_POLL_MS, self.poll_ingest_status)
 
     def read_database(self):
         logging.debug('Reading database')
@@ -146,6 +317,7 @@ class PSCXL_GUI:
 
     def update_sheet_selector(self, event=None):
         logging.debug('Updating sheet selector')
+        self.stop_search()
         # Get the selected workbook name
         selected_workbook = self.workbook_selector.get()
 
@@ -164,6 +336,7 @@ class PSCXL_GUI:
     def update_table(self, event=None):
         logging.debug('Updating table')
         # Clear the current table
+        self.stop_search()
         self.clear_table()
 
         # Get the selected workbook and sheet name
@@ -173,25 +346,81 @@ class PSCXL_GUI:
         if selected_workbook == "--Select--" or selected_sheet == "--Select--":
             return
 
-        # Query the database for the selected workbook and sheet
-        rows = self.db.fetch_data(selected_workbook, selected_sheet)
+        # Page rows in from the database as the table scrolls
+        row_count = self.db.count_data(selected_workbook, selected_sheet)
+        self.table.set_source(row_count, self.table_page_loader(selected_workbook, selected_sheet))
+
+    def table_page_loader(self, workbook_name, sheet_name):
+        def fetch_rows(offset, limit):
+            # Keyed by where the row is stored; the table shows the precomputed display form
+            return [((workbook_name, sheet_name, value), (workbook_name, sheet_name, display_value, quantity, stacked))
+                    for value, display_value, quantity, stacked
+                    in self.db.fetch_data_page(workbook_name, sheet_name, offset, limit)]
+        return fetch_rows
+
+    def refresh_table(self):
+        # Reload the rows on screen after an edit without jumping back to the top
+        if self.search_query is not None:
+            self.start_search(self.search_query)
+            return
+        selected_workbook = self.workbook_selector.get()
+        selected_sheet = self.sheet_selector.get()
+        if selected_workbook == "--Select--" or selected_sheet == "--Select--":
+            return
+        self.table.refresh(self.db.count_data(selected_workbook, selected_sheet))
 
-        # Insert data into the database Treeview widget
-        for row in rows:
-            display_row = list(row)
-            if isinstance(display_row[2], str):
-                display_row[2] = display_row[2].replace(" " * 10, " ")  # Show single value without extra spaces
-            self.db_tree.insert(parent='', index='end', values=display_row)
+    def search_labels(self, event=None):
+        query = self.search_entry.get().strip()
+        logging.debug('Searching labels: %s', query)
+        if not query:
+            self.update_table()
+            return
+        self.start_search(query)
+
+    def start_search(self, query):
+        # Show matches from every workbook and sheet; rows are added as they come off the cursor
+        self.stop_search()
+        self.search_query = query
+        self.search_cursor = self.db.search_labels(query)
+        self.search_results = []
+        self.table.set_source(0, self.search_page_loader)
+        self.status_label.config(text=f"Searching for {query}...")
+        self.root.after_idle(self.load_search_results, self.search_generation)
+
+    def load_search_results(self, generation):
+        if generation != self.search_generation:
+            return  # A newer search or a sheet selection replaced this one
+        rows = self.search_cursor.fetchmany(SEARCH_CHUNK)
+        self.search_results.extend(rows)
+        self.table.grow(len(self.search_results))
+        if len(rows) == SEARCH_CHUNK:
+            self.root.after(1, self.load_search_results, generation)
+        else:
+            self.search_cursor.close()
+            self.search_cursor = None
+            self.status_label.config(text=f"{len(self.search_results)} labels found for {self.search_query}")
+
+    def search_page_loader(self, offset, limit):
+        return [((workbook_name, sheet_name, value), (workbook_name, sheet_name, display_value, quantity, stacked))
+                for workbook_name, sheet_name, value, display_value, quantity, stacked
+                in self.search_results[offset:offset + limit]]
+
+    def stop_search(self):
+        self.search_generation += 1
+        if self.search_cursor is not None:
+            self.search_cursor.close()
+            self.search_cursor = None
+        self.search_query = None
+        self.search_results = []
 
     def clear_table(self):
         logging.debug('Clearing table')
-        for item in self.db_tree.get_children():
-            self.db_tree.delete(item)
+        self.table.clear()
 
     def show_context_menu(self, event):
         logging.debug('Showing context menu')
-        # Show context menu on right-click
-        if not self.db_tree.selection():
+        # Show context menu on right-click; the selection may have scrolled off screen
+        if not self.table.selected_rows():
             messagebox.showinfo("Info", "Please select a row first.")
         else:
             try:
@@ -201,20 +430,24 @@ class PSCXL_GUI:
 
     def edit_row(self):
         logging.debug('Editing row')
-        # Get the selected row
-        selected_item = self.db_tree.selection()
-        if not selected_item:
-            messagebox.showinfo("Info", "Please select a row first.")
+        # Get the selected row (the first one, if several are selected)
+        rows = self.selected_rows()
+        if not rows:
             return
-        item = self.db_tree.item(selected_item)
+        key, values = rows[0]
 
-        # Get current values
-        current_values = item['values']
+        # Get current values, editing the stored value rather than its display form
+        current_values = list(values)
+        current_values[2] = key[2]
         new_values = self.edit_popup(current_values)
         if new_values:
             # Update the database
-            self.db.update_data(current_values[0], current_values[1], current_values[2], new_values[2], new_values[3], new_values[4])
-            self.update_table()
+            try:
+                self.db.update_data(current_values[0], current_values[1], current_values[2], new_values[2], new_values[3], new_values[4])
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"Failed to update row, nothing was changed: {e}")
+                return
+            self.refresh_table()
 
     def add_row(self):
         logging.debug('Adding row')
@@ -230,8 +463,88 @@ class PSCXL_GUI:
         new_values = self.edit_popup([selected_workbook, selected_sheet, "", 0, 0], new_row=True)
         if new_values:
             # Insert into the database
-            self.db.insert_data(new_values[0], new_values[1], new_values[2], new_values[3], new_values[4])
-            self.update_table()
+            try:
+                self.db.insert_data(new_values[0], new_values[1], new_values[2], new_values[3], new_values[4])
+            except sqlite3.Error as e:
+                messagebox.showerror("Error", f"Failed to add row: {e}")
+                return
+            self.refresh_table()
+
+    def selected_rows(self):
+        rows = self.table.selected_rows()
+        if not rows:
+            messagebox.showinfo("Info", "Please select a row first.")
+        return rows
+
+    def set_selected_quantity(self):
+        rows = self.selected_rows()
+        if not rows:
+            return
+        quantity = simpledialog.askinteger("Set Quantity", f"Quantity for {len(rows)} selected labels:",
+                                           minvalue=0, parent=self.root)
+        if quantity is not None:
+            self.apply_bulk_edit([(key, key[2], quantity, values[4]) for key, values in rows])
+
+    def toggle_selected_stacked(self):
+        rows = self.selected_rows()
+        if rows:
+            self.apply_bulk_edit([(key, key[2], values[3], 0 if values[4] else 1) for key, values in rows])
+
+    def replace_in_selected(self):
+        rows = self.selected_rows()
+        if not rows:
+            return
+        find = simpledialog.askstring("Find/Replace", "Find in values:", parent=self.root)
+        if not find:
+            return
+        replace = simpledialog.askstring("Find/Replace", f"Replace \"{find}\" with:", parent=self.root)
+        if replace is None:
+            return
+        self.apply_bulk_edit([(key, key[2].replace(find, replace), values[3], values[4])
+                              for key, values in rows if find in key[2]])
+
+    def delete_selected(self):
+        rows = self.selected_rows()
+        if not rows or not messagebox.askyesno("Delete Rows", f"Delete {len(rows)} selected labels?"):
+            return
+        logging.debug('Deleting %d rows', len(rows))
+        try:
+            self.db.delete_many([key for key, _ in rows])
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"Failed to delete rows: {e}")
+            return
+        self.refresh_table()
+
+    def apply_bulk_edit(self, edits):
+        # edits are (key, new_value, new_quantity, new_stacked), written in one transaction
+        if not edits:
+            return
+        logging.debug('Bulk editing %d rows', len(edits))
+        try:
+            self.db.update_many([(workbook_name, sheet_name, value, new_value, new_quantity, new_stacked)
+                                 for (workbook_name, sheet_name, value), new_value, new_quantity, new_stacked in edits])
+        except sqlite3.Error as e:
+            messagebox.showerror("Error", f"Failed to update rows, nothing was changed: {e}")
+            return
+
+        if any(key[2] != new_value for key, new_value, _, _ in edits):
+            # Renamed rows can move or merge, so re-read the window
+            self.refresh_table()
+            return
+
+        # Only quantities and stacked flags changed: patch the affected rows where they are
+        changed = {}
+        for key, _, new_quantity, new_stacked in edits:
+            values = self.table.selected.get(key)
+            if values is not None:
+                changed[key] = (values[0], values[1], values[2], new_quantity, new_stacked)
+        self.search_results = [
+            (workbook_name, sheet_name, value, display_value) + changed[(workbook_name, sheet_name, value)][3:]
+            if (workbook_name, sheet_name, value) in changed
+            else (workbook_name, sheet_name, value, display_value, quantity, stacked)
+            for workbook_name, sheet_name, value, display_value, quantity, stacked in self.search_results
+        ]
+        self.table.update_rows(changed)
 
     def edit_popup(self, values, new_row=False):
         logging.debug('Opening edit popup')
@@ -277,43 +590,44 @@ class PSCXL_GUI:
         # Open a file dialog to select the save location for the new Excel file
         save_path = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=(("Excel files", "*.xlsx"), ("All files", "*.*")),
+            filetypes=(("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("TSV files", "*.tsv"), ("All files", "*.*")),
             title="Save Excel File"
         )
         if save_path:
+            layout = 'compact' if self.compact_export.get() else 'expanded'
             self.disable_buttons()
-            threading.Thread(target=self.run_export_to_excel, args=(save_path,)).start()
+            self.status_label.config(text="Exporting...")
+            threading.Thread(target=self.run_export_to_excel, args=(save_path, layout), daemon=True).start()
+            self.root.after(100, self.poll_export_queue)
 
-    def run_export_to_excel(self, save_path):
+    def run_export_to_excel(self, save_path, layout='expanded'):
+        # Runs on a worker thread: the export opens its own connection and reports back through export_queue
         try:
-            new_wb = openpyxl.Workbook()
-            new_wb.remove(new_wb.active)  # Remove the default sheet
-
-            workbooks = self.db.fetch_workbooks()
-            for workbook_name in workbooks:
-                sheets = self.db.fetch_sheets(workbook_name)
-                for sheet_name in sheets:
-                    new_ws = new_wb.create_sheet(title=sheet_name)
-                    new_ws.append(['Value', 'Quantity'])
-
-                    rows = self.db.fetch_data(workbook_name, sheet_name)
-                    for row in rows:
-                        value, quantity, stacked = row
-                        for _ in range(quantity):
-                            if stacked:
-                                value = value.replace(" ", " " * 10)  # Ensure 10 spaces between stacked items
-                            new_ws.append([value])
-
-            new_wb.save(save_path)
-            logging.debug(f'Data successfully exported to {save_path}')
-            messagebox.showinfo("Info", "Data successfully exported to Excel")
+            row_count = pscxl_export.export_data(self.db.db_name, save_path, layout)
+            logging.debug('Data successfully exported to %s', save_path)
+            self.export_queue.put(('done', save_path, row_count))
         except Exception as e:
             logging.error(f'Error saving Excel file: {e}')
-            messagebox.showerror("Error", f"Failed to export data to Excel: {e}")
-        finally:
-            self.enable_buttons()
+            self.export_queue.put(('error', save_path, str(e)))
+
+    def poll_export_queue(self):
+        try:
+            kind, save_path, detail = self.export_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(100, self.poll_export_queue)
+            return
+
+        self.enable_buttons()
+        if kind == 'done':
+            self.status_label.config(text=f"Exported {detail} rows to {save_path}")
+            messagebox.showinfo("Info", "Data successfully exported")
+        else:
+            self.status_label.config(text="Export failed")
+            messagebox.showerror("Error", f"Failed to export data: {detail}")
 
 if __name__ == "__main__":
+    # Configure logging (see pscxl_logging for the settings)
+    pscxl_logging.setup_logging()
     logging.debug('Starting application')
     root = tk.Tk()
     app = PSCXL_GUI(root)
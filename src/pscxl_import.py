@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pscxl_ingest
+import pscxl_logging
+import pscxl_xlsx
+from pscxl_database import PSCXL_Database
+from pscxl_timing import span
+
+# What an incremental import has to do for one file:
+#   file_fingerprint: (size, mtime) of the file
+#   fingerprints: {sheet name: fingerprint} from the xlsx package ({} if it couldn't be read)
+#   unchanged_sheets: sheets whose fingerprint matches the last import and can be skipped
+ImportPlan = namedtuple('ImportPlan', ['file_path', 'workbook_name', 'file_fingerprint', 'fingerprints', 'unchanged_sheets'])
+
+def plan_import(db, file_path, force=False):
+    # Returns None when the file is byte-for-byte where the last import left it
+    workbook_name = pscxl_ingest.workbook_base_name(file_path)
+    stat = os.stat(file_path)
+    file_fingerprint = (stat.st_size, stat.st_mtime)
+    if not force and db.fetch_file_fingerprint(workbook_name) == file_fingerprint:
+        return None
+
+    fingerprints = pscxl_xlsx.sheet_fingerprints(file_path)
+    stored = {} if force else db.fetch_sheet_fingerprints(workbook_name)
+    unchanged_sheets = frozenset(name for name, fingerprint in fingerprints.items() if stored.get(name) == fingerprint)
+    return ImportPlan(file_path, workbook_name, file_fingerprint, fingerprints, unchanged_sheets)
+
+def unchanged_counts(plan):
+    # When every sheet matches its fingerprint the workbook doesn't need to be opened at all
+    if plan.fingerprints and plan.unchanged_sheets == frozenset(plan.fingerprints):
+        return [(sheet_name, None) for sheet_name in plan.fingerprints]
+    return None
+
+def apply_import(db, plan, sheet_counts):
+    # sheet_counts covers every sheet in the workbook, with None for the skipped ones
+    sheet_names = [sheet_name for sheet_name, _ in sheet_counts]
+    with span('count', workbook=plan.workbook_name) as record:
+        changed_rows = {sheet_name: pscxl_ingest.sheet_label_map(counts)
+                        for sheet_name, counts in sheet_counts if counts is not None}
+        record['rows'] = sum(map(len, changed_rows.values()))
+    sheet_fingerprints = {sheet_name: plan.fingerprints.get(sheet_name) for sheet_name in sheet_names}
+    with span('db_write', workbook=plan.workbook_name) as record:
+        changes = db.update_workbook_sheets(plan.workbook_name, sheet_names, changed_rows,
+                                            sheet_fingerprints, plan.file_fingerprint)
+        record['rows'] = changes
+    return changes
+
+def parse_workbook(file_path, skip_sheets=()):
+    # Runs in a worker process; only the compact per-sheet Counters travel back
+    return pscxl_ingest.read_workbook_counts(file_path, skip_sheets)
+
+def find_workbooks(folder):
+    # Excel leaves "~$name.xlsx" lock files next to open workbooks; skip them
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith('.xlsx') and not name.startswith('~$')
+    )
+
+def import_workbooks(file_paths, db_name, max_workers=None, progress=None, cancel_event=None, force=False):
+    # Parse workbooks across CPU cores and funnel every write through a single connection in this process.
+    # Each workbook is updated in its own transaction as soon as its parse finishes; unchanged files and
+    # sheets are never sent to a worker.
+    # Returns (file_path, workbook_name, changed_rows, error) tuples in completion order.
+    file_paths = list(file_paths)
+    if not file_paths:
+        return []
+    results = []
+    db = PSCXL_Database(db_name)
+    executor = None
+    try:
+        plans = {}
+        for path in file_paths:
+            workbook_name = pscxl_ingest.workbook_base_name(path)
+            try:
+                plan = plan_import(db, path, force)
+            except OSError as e:
+                logging.error(f'Error importing {path}: {e}')
+                results.append((path, workbook_name, 0, str(e)))
+            else:
+                if plan is not None:
+                    plans[path] = plan  # Reported once it has been written
+                    continue
+                results.append((path, workbook_name, 0, None))
+            if progress:
+                progress(workbook_name, len(results), len(file_paths))
+
+        for path, plan in list(plans.items()):
+            sheet_counts = unchanged_counts(plan)
+            if sheet_counts is not None:
+                del plans[path]
+                results.append((path, plan.workbook_name, apply_import(db, plan, sheet_counts), None))
+                if progress:
+                    progress(plan.workbook_name, len(results), len(file_paths))
+
+        if plans:
+            max_workers = max_workers or min(len(plans), os.cpu_count() or 1)
+            executor = ProcessPoolExecutor(max_workers=max_workers, initializer=pscxl_logging.init_worker,
+                                           initargs=pscxl_logging.worker_initargs())
+            futures = {executor.submit(parse_workbook, path, plan.unchanged_sheets): plan
+                       for path, plan in plans.items()}
+            for future in as_completed(futures):
+                plan = futures[future]
+                try:
+                    changes = apply_import(db, plan, future.result())
+                    results.append((plan.file_path, plan.workbook_name, changes, None))
+                except Exception as e:
+                    logging.error(f'Error importing {plan.file_path}: {e}')
+                    results.append((plan.file_path, plan.workbook_name, 0, str(e)))
+                if progress:
+                    progress(plan.workbook_name, len(results), len(file_paths))
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+    finally:
+        # Drop queued parses on cancel; workbooks already written stay written
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        db.close()
+    return results
+
+class PSCXL_ImportWorker(threading.Thread):
+    # Parses a workbook and writes it to the database off the Tk thread.
+    # Results are posted to result_queue as tuples whose first item is the message kind:
+    #   ('progress', workbook, sheet_name, index, total)
+    #   ('done', workbook, changed_rows)
+    #   ('cancelled', workbook)
+    #   ('error', workbook, message)
+    def __init__(self, file_path, db_name, result_queue, force=False):
+        super().__init__(daemon=True)
+        self.file_path = file_path
+        self.db_name = db_name
+        self.result_queue = result_queue
+        self.force = force
+        self.workbook_name = pscxl_ingest.workbook_base_name(file_path)
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def report_progress(self, sheet_name, index, total):
+        self.result_queue.put(('progress', self.workbook_name, sheet_name, index, total))
+
+    def run(self):
+        logging.debug('Import worker started: %s', self.file_path)
+        # SQLite connections can't be shared across threads, so the worker opens its own
+        db = PSCXL_Database(self.db_name)
+        try:
+            plan = plan_import(db, self.file_path, self.force)
+            if plan is None:
+                logging.debug('Import skipped, file unchanged: %s', self.file_path)
+                self.result_queue.put(('done', self.workbook_name, 0))
+                return
+
+            sheet_counts = unchanged_counts(plan)
+            if sheet_counts is None:
+                sheet_counts = []
+                # closing() shuts the reader (and its file handle) straight away when a cancel breaks out early
+                with closing(pscxl_ingest.iter_workbook_counts(self.file_path, self.report_progress,
+                                                               plan.unchanged_sheets)) as workbook_counts:
+                    for sheet_name, counts in workbook_counts:
+                        if self.cancelled():
+                            break
+                        sheet_counts.append((sheet_name, counts))
+
+            # Nothing has been written yet, so a cancelled import leaves the database unchanged
+            if self.cancelled():
+                logging.debug('Import cancelled: %s', self.file_path)
+                self.result_queue.put(('cancelled', self.workbook_name))
+                return
+
+            changes = apply_import(db, plan, sheet_counts)
+            logging.debug('Import finished: %s (%d rows changed)', self.file_path, changes)
+            self.result_queue.put(('done', self.workbook_name, changes))
+        except Exception as e:
+            logging.error(f'Error importing {self.file_path}: {e}')
+            self.result_queue.put(('error', self.workbook_name, str(e)))
+        finally:
+            db.close()
+
+class PSCXL_BatchImportWorker(PSCXL_ImportWorker):
+    # Imports many workbooks through import_workbooks. Progress messages carry None for
+    # the sheet name and count finished workbooks instead of sheets.
+    def __init__(self, file_paths, db_name, result_queue, max_workers=None, force=False):
+        super().__init__(file_paths[0] if file_paths else '', db_name, result_queue, force)
+        self.file_paths = list(file_paths)
+        self.max_workers = max_workers
+        self.workbook_name = f"{len(self.file_paths)} workbooks"
+
+    def report_workbook(self, workbook_name, index, total):
+        self.result_queue.put(('progress', workbook_name, None, index, total))
+
+    def run(self):
+        logging.debug('Batch import worker started: %d files', len(self.file_paths))
+        try:
+            results = import_workbooks(self.file_paths, self.db_name, self.max_workers,
+                                       self.report_workbook, self.cancel_event, self.force)
+            failed = [(workbook_name, error) for _, workbook_name, _, error in results if error]
+            if failed:
+                details = "\n".join(f"{workbook_name}: {error}" for workbook_name, error in failed)
+                self.result_queue.put(('error', self.workbook_name, details))
+            elif self.cancelled():
+                self.result_queue.put(('cancelled', self.workbook_name))
+            else:
+                self.result_queue.put(('done', self.workbook_name, sum(result[2] for result in results)))
+        except Exception as e:
+            logging.error(f'Error in batch import: {e}')
+            self.result_queue.put(('error', self.workbook_name, str(e)))
@@ -0,0 +1,112 @@
+import logging
+import os
+import zipfile
+from collections import Counter
+from itertools import chain
+import xml.etree.ElementTree as ET
+import openpyxl
+import pscxl_config
+import pscxl_xlsx
+from pscxl_labels import parse_label
+from pscxl_timing import span
+
+def workbook_base_name(file_path):
+    # "C:/jobs/24-0005E2.xlsx" -> "24-0005E2"
+    return os.path.basename(file_path).split('.')[0]
+
+def count_duplicates(rows):
+    # Shared label counting engine: counts every non-empty cell value in an iterable of rows.
+    # Counter's C loop over a flattened iterator does the work, so rows can be a list of lists or
+    # a lazy row generator. Keys keep the order values first appear in.
+    counter = Counter(chain.from_iterable(rows))
+    counter.pop(None, None)  # Skip empty cells
+    return counter
+
+def count_sheet_values(sheet):
+    logging.debug('Counting values in sheet: %s', sheet.title)
+    return count_duplicates(sheet.iter_rows(values_only=True))
+
+XLSX_READERS = ('direct', 'openpyxl')
+
+def iter_workbook_counts(file_path, progress=None, skip_sheets=()):
+    # Yields (sheet_name, Counter) for every sheet in workbook order.
+    # Sheets named in skip_sheets are not read at all and yield None instead of a Counter.
+    settings = pscxl_config.load_config()['ingest']
+    xlsx_reader = settings.get('xlsx_reader').lower()
+    if xlsx_reader not in XLSX_READERS:
+        raise ValueError(f"Invalid xlsx_reader: {xlsx_reader}")
+    if xlsx_reader == 'direct':
+        spill_bytes = settings.getint('shared_strings_spill_bytes')
+        try:
+            reader = pscxl_xlsx.PSCXL_XlsxReader(file_path, None if spill_bytes < 0 else spill_bytes)
+        except (zipfile.BadZipFile, KeyError, ValueError, ET.ParseError) as e:
+            logging.debug('Direct xlsx reader unavailable for %s: %s', file_path, e)
+        else:
+            with reader:
+                yield from iter_direct_counts(reader, file_path, progress, skip_sheets)
+            return
+    yield from iter_openpyxl_counts(file_path, progress, skip_sheets)
+
+def iter_direct_counts(reader, file_path, progress, skip_sheets):
+    # Sheets the direct reader can't handle are read through openpyxl, opened only if needed
+    workbook_name = workbook_base_name(file_path)
+    wb = None
+    try:
+        for index, sheet_name in enumerate(reader.sheet_names, start=1):
+            if sheet_name in skip_sheets:
+                counts = None
+            else:
+                with span('read_sheet', workbook=workbook_name, sheet=sheet_name) as record:
+                    try:
+                        counts = reader.count_sheet(sheet_name)
+                    except pscxl_xlsx.PSCXL_UnsupportedXlsx as e:
+                        logging.debug('Reading %s/%s through openpyxl: %s', workbook_name, sheet_name, e)
+                        if wb is None:
+                            wb = openpyxl.load_workbook(file_path, read_only=True)
+                        counts = count_sheet_values(wb[sheet_name])
+                    record['rows'] = sum(counts.values())
+            if progress:
+                progress(sheet_name, index, len(reader.sheet_names))
+            yield sheet_name, counts
+    finally:
+        if wb is not None:
+            wb.close()
+
+def iter_openpyxl_counts(file_path, progress=None, skip_sheets=()):
+    # Read-only mode streams rows straight from the xlsx archive, so only one row is held at a time.
+    workbook_name = workbook_base_name(file_path)
+    with span('load', workbook=workbook_name):
+        wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        sheet_names = wb.sheetnames
+        for index, sheet_name in enumerate(sheet_names, start=1):
+            if sheet_name in skip_sheets:
+                counts = None
+            else:
+                # Reading and counting are one streaming pass, so they share a span
+                with span('read_sheet', workbook=workbook_name, sheet=sheet_name) as record:
+                    counts = count_sheet_values(wb[sheet_name])
+                    record['rows'] = sum(counts.values())
+            if progress:
+                progress(sheet_name, index, len(sheet_names))
+            yield sheet_name, counts
+    finally:
+        wb.close()  # Read-only workbooks keep the file handle open until closed
+
+def label_rows(counts):
+    # Convert counted cell values into (value, quantity, stacked) database rows
+    for raw_value, count in counts.items():
+        label = parse_label(raw_value)
+        yield label.value, count, label.stacked
+
+def sheet_label_map(counts):
+    # {value: (quantity, stacked)}; when two raw values normalize to the same label the first one wins,
+    # matching INSERT OR IGNORE in the full import
+    rows = {}
+    for value, count, stacked in label_rows(counts):
+        rows.setdefault(value, (count, stacked))
+    return rows
+
+def read_workbook_counts(file_path, skip_sheets=()):
+    # Per-sheet label Counters in workbook order; small enough to hand between processes
+    return list(iter_workbook_counts(file_path, skip_sheets=skip_sheets))
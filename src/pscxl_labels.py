@@ -0,0 +1,32 @@
+from collections import namedtuple
+from functools import lru_cache
+
+# Stacked labels are two wire numbers printed one above the other. In the source workbooks they are
+# a single cell with a run of spaces between the parts ("L1             L1"). The rules below are the
+# original GUI's, kept as they were: the printed form widens every single space to ten (so a run of
+# n spaces becomes 10 * n), and the table view collapses each run of exactly ten spaces to one.
+PRINT_SEPARATOR = " " * 10
+
+# The same rules as SQL, used by the generated display_value and print_value columns of labels
+DISPLAY_VALUE_SQL = "replace(value, '          ', ' ')"
+PRINT_VALUE_SQL = "CASE WHEN stacked THEN replace(value, ' ', '          ') ELSE value END"
+
+# value: normalized text stored in the database
+# stacked: 1 if the label is stacked, else 0
+Label = namedtuple('Label', ['value', 'stacked'])
+
+# Label text repeats heavily within and across workbooks, so each distinct cell value is parsed once.
+# typed=True keeps 1, 1.0 and True apart; they hash alike but normalize to different text.
+@lru_cache(maxsize=65536, typed=True)
+def parse_label(raw_value):
+    # Normalize the value
+    value = str(raw_value).strip()
+    # Check if value is a string before checking for spaces
+    if isinstance(raw_value, str) and " " in value:
+        return Label(value, 1)  # Assume values with spaces are stacked
+    return Label(value, 0)
+
+@lru_cache(maxsize=65536)
+def display_value(value):
+    # Show single value without extra spaces
+    return value.replace(PRINT_SEPARATOR, " ")
@@ -0,0 +1,62 @@
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+import pscxl_config
+
+# Logging backend shared by the front ends. Log calls only put the record on a queue; a listener
+# thread does the formatting and disk writes, so a slow disk never stalls the Tk event loop.
+# The file rotates instead of being truncated on every start. Level, file name and rotation come
+# from the [logging] section of pscxl.ini or PSCXL_LOGGING_* environment variables.
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+log_queue = None
+log_listener = None
+
+def setup_logging(config=None):
+    # Call once at startup, before any worker processes are started. Safe to call again.
+    global log_queue, log_listener
+    if log_listener is not None:
+        return log_listener
+
+    settings = (config or pscxl_config.load_config())['logging']
+    level = settings.get('level').upper()
+    if level not in LOG_LEVELS:
+        raise ValueError(f"Invalid logging level: {level}")
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        settings.get('file'), maxBytes=settings.getint('max_bytes'), backupCount=settings.getint('backup_count'),
+        encoding='utf-8', delay=True)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    # A process-safe queue, so import workers in other processes can log through the same listener
+    log_queue = multiprocessing.Queue(-1)
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    install_queue_handler(log_queue, level)
+    log_listener.start()
+    atexit.register(stop_logging)
+    return log_listener
+
+def install_queue_handler(queue, level):
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(queue))
+    root.setLevel(level)
+
+def init_worker(queue, level):
+    # ProcessPoolExecutor initializer: send the worker's records to the parent's listener
+    if queue is not None:
+        install_queue_handler(queue, level)
+
+def worker_initargs():
+    # (queue, level) for init_worker; the queue is None when setup_logging hasn't run
+    return (log_queue, logging.getLogger().getEffectiveLevel())
+
+def stop_logging():
+    # Flushes queued records to disk
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
@@ -1,7 +1,10 @@
 import tkinter as tk
+import pscxl_logging
 from pscxl_gui import PSCXL_GUI
 
 if __name__ == "__main__":
+    # Configure logging before the window (and any import workers) start
+    pscxl_logging.setup_logging()
     root = tk.Tk()
     app = PSCXL_GUI(root)
     root.mainloop()
@@ -0,0 +1,219 @@
+import sqlite3
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from itertools import groupby
+import pscxl_labels
+
+# The label store behind the front ends. PSCXL_Database keeps labels in SQLite; PSCXL_MemoryStorage keeps
+# them in memory as columns, for batch jobs and tests that don't need a file. Either can be copied into
+# the other with snapshot() and restore().
+# Rows are (workbook_name, sheet_name, value, quantity, stacked); a workbook or sheet exists while it has
+# at least one label. Labels are unique per sheet by value and come back ordered by value.
+
+class PSCXL_Storage(ABC):
+    @abstractmethod
+    def insert_data(self, workbook_name, sheet_name, value, quantity, stacked):
+        # Does nothing when the sheet already has the value
+        pass
+
+    @abstractmethod
+    def insert_many(self, rows):
+        pass
+
+    @abstractmethod
+    def update_data(self, workbook_name, sheet_name, value, new_value, new_quantity, new_stacked):
+        # Raises sqlite3.IntegrityError when new_value is already used by another label on the sheet
+        pass
+
+    @abstractmethod
+    def delete_data(self, workbook_name, sheet_name, value):
+        pass
+
+    @abstractmethod
+    def clear_workbook_data(self, workbook_name):
+        pass
+
+    @abstractmethod
+    def fetch_workbooks(self):
+        pass
+
+    @abstractmethod
+    def fetch_sheets(self, workbook_name):
+        pass
+
+    @abstractmethod
+    def fetch_data(self, workbook_name, sheet_name):
+        # [(value, quantity, stacked)]
+        pass
+
+    @abstractmethod
+    def count_data(self, workbook_name, sheet_name):
+        pass
+
+    @abstractmethod
+    def fetch_data_page(self, workbook_name, sheet_name, offset, limit):
+        # [(value, display_value, quantity, stacked)]; a negative limit reads to the end of the sheet
+        pass
+
+    @abstractmethod
+    def iter_labels(self):
+        # Every row, grouped by workbook and sheet
+        pass
+
+    @abstractmethod
+    def replace_all(self, rows):
+        # Swap the whole store for rows in one step
+        pass
+
+    def close(self):
+        pass
+
+    def snapshot(self):
+        # Copy every label into a new in-memory store
+        snapshot = PSCXL_MemoryStorage()
+        snapshot.replace_all(self.iter_labels())
+        return snapshot
+
+    def restore(self, source):
+        # Replace this store's contents with another store's (e.g. a snapshot)
+        self.replace_all(source.iter_labels())
+
+class PSCXL_SheetColumns:
+    # One sheet's labels as parallel columns sorted by value instead of a tuple per label; lookups are
+    # binary searches of the value column. Quantities and stacked flags are plain lists because either
+    # can be None, as the SQLite columns can be NULL.
+    def __init__(self, rows=()):
+        self.load(rows)
+
+    def load(self, rows):
+        # rows are (value, quantity, stacked) with unique values
+        rows = sorted(rows, key=lambda row: row[0])
+        self.values = [row[0] for row in rows]
+        self.quantities = [row[1] for row in rows]
+        self.stacked = [row[2] for row in rows]
+
+    def __len__(self):
+        return len(self.values)
+
+    def find(self, value):
+        # Index of value, or None
+        index = bisect_left(self.values, value)
+        if index < len(self.values) and self.values[index] == value:
+            return index
+        return None
+
+    def insert(self, value, quantity, stacked):
+        index = bisect_left(self.values, value)
+        if index < len(self.values) and self.values[index] == value:
+            return False
+        self.values.insert(index, value)
+        self.quantities.insert(index, quantity)
+        self.stacked.insert(index, stacked)
+        return True
+
+    def extend(self, rows):
+        # Bulk insert: one sort instead of shifting the columns for every row. Existing values win.
+        labels = dict(zip(self.values, zip(self.quantities, self.stacked)))
+        for value, quantity, stacked in rows:
+            labels.setdefault(value, (quantity, stacked))
+        self.load((value, quantity, stacked) for value, (quantity, stacked) in labels.items())
+
+    def delete(self, value):
+        index = self.find(value)
+        if index is None:
+            return False
+        del self.values[index]
+        del self.quantities[index]
+        del self.stacked[index]
+        return True
+
+    def rows(self, start=0, stop=None):
+        return list(zip(self.values[start:stop], self.quantities[start:stop], self.stacked[start:stop]))
+
+class PSCXL_MemoryStorage(PSCXL_Storage):
+    def __init__(self):
+        self.workbooks = {}  # {workbook_name: {sheet_name: PSCXL_SheetColumns}}
+
+    def sheet(self, workbook_name, sheet_name, create=False):
+        sheets = self.workbooks.get(workbook_name)
+        if sheets is None:
+            if not create:
+                return None
+            sheets = self.workbooks[workbook_name] = {}
+        columns = sheets.get(sheet_name)
+        if columns is None and create:
+            columns = sheets[sheet_name] = PSCXL_SheetColumns()
+        return columns
+
+    def prune(self, workbook_name, sheet_name):
+        # Drop a sheet, and then its workbook, once the last label is gone
+        sheets = self.workbooks[workbook_name]
+        if not sheets[sheet_name]:
+            del sheets[sheet_name]
+            if not sheets:
+                del self.workbooks[workbook_name]
+
+    def insert_data(self, workbook_name, sheet_name, value, quantity, stacked):
+        self.sheet(workbook_name, sheet_name, create=True).insert(value, quantity, stacked)
+
+    def insert_many(self, rows):
+        for (workbook_name, sheet_name), sheet_rows in groupby(rows, key=lambda row: row[:2]):
+            self.sheet(workbook_name, sheet_name, create=True).extend(row[2:] for row in sheet_rows)
+
+    def update_data(self, workbook_name, sheet_name, value, new_value, new_quantity, new_stacked):
+        columns = self.sheet(workbook_name, sheet_name)
+        index = columns.find(value) if columns is not None else None
+        if index is None:
+            return
+        if new_value == value:
+            columns.quantities[index] = new_quantity
+            columns.stacked[index] = new_stacked
+            return
+        if columns.find(new_value) is not None:
+            # The same error the SQLite store raises, so callers handle both alike
+            raise sqlite3.IntegrityError(f"{workbook_name}/{sheet_name} already has {new_value}")
+        columns.delete(value)
+        columns.insert(new_value, new_quantity, new_stacked)
+
+    def delete_data(self, workbook_name, sheet_name, value):
+        columns = self.sheet(workbook_name, sheet_name)
+        if columns is not None and columns.delete(value):
+            self.prune(workbook_name, sheet_name)
+
+    def clear_workbook_data(self, workbook_name):
+        self.workbooks.pop(workbook_name, None)
+
+    def fetch_workbooks(self):
+        return sorted(self.workbooks)
+
+    def fetch_sheets(self, workbook_name):
+        return sorted(self.workbooks.get(workbook_name, ()))
+
+    def fetch_data(self, workbook_name, sheet_name):
+        columns = self.sheet(workbook_name, sheet_name)
+        return columns.rows() if columns is not None else []
+
+    def count_data(self, workbook_name, sheet_name):
+        columns = self.sheet(workbook_name, sheet_name)
+        return len(columns) if columns is not None else 0
+
+    def fetch_data_page(self, workbook_name, sheet_name, offset, limit):
+        columns = self.sheet(workbook_name, sheet_name)
+        if columns is None:
+            return []
+        return [(value, pscxl_labels.display_value(value), quantity, stacked)
+                for value, quantity, stacked in columns.rows(offset, offset + limit if limit >= 0 else None)]
+
+    def iter_labels(self):
+        for workbook_name in sorted(self.workbooks):
+            sheets = self.workbooks[workbook_name]
+            for sheet_name in sorted(sheets):
+                for value, quantity, stacked in sheets[sheet_name].rows():
+                    yield workbook_name, sheet_name, value, quantity, stacked
+
+    def replace_all(self, rows):
+        workbooks = {}
+        for (workbook_name, sheet_name), sheet_rows in groupby(rows, key=lambda row: row[:2]):
+            columns = workbooks.setdefault(workbook_name, {}).setdefault(sheet_name, PSCXL_SheetColumns())
+            columns.extend(row[2:] for row in sheet_rows)
+        self.workbooks = workbooks
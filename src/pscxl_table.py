@@ -0,0 +1,189 @@
+class PSCXL_VirtualTable:
+    # Paged view over a ttk.Treeview: the tree only ever holds the rows that fit on screen.
+    # Rows come from fetch_rows(offset, limit), which should return (key, display values) pairs for
+    # the rows starting at offset; the key identifies the row in the database, since the displayed
+    # text can differ from what is stored. A window of rows around the visible ones (the overscan)
+    # is kept so small scrolls don't go back to the database.
+    # The selection is tracked by key, so it survives scrolling and can cover rows that are off screen.
+    def __init__(self, tree, scrollbar, overscan=50):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.overscan = overscan
+        self.row_count = 0
+        self.fetch_rows = None
+        self.offset = 0
+        self.cache_offset = 0
+        self.cache_rows = []
+        self.item_keys = {}
+        self.item_values = {}
+        self.selected = {}  # key -> display values of every selected row
+
+        self.scrollbar.config(command=self.yview)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<Control-a>", self.select_all)
+        self.tree.bind("<Button-1>", self.on_click, add='+')
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Up>", self.on_key_up)
+        self.tree.bind("<Down>", self.on_key_down)
+        self.tree.bind("<Prior>", lambda event: self.scroll(-self.page_size()))
+        self.tree.bind("<Next>", lambda event: self.scroll(self.page_size()))
+
+    def page_size(self):
+        return int(self.tree.cget('height'))
+
+    def set_source(self, row_count, fetch_rows):
+        # Show a new result set from the top
+        self.row_count = row_count
+        self.fetch_rows = fetch_rows
+        self.offset = 0
+        self.cache_rows = []
+        self.selected = {}
+        self.render()
+
+    def refresh(self, row_count):
+        # Re-read the current window after the underlying rows changed, keeping the scroll position.
+        # Selected rows may have been renamed or deleted, so the selection is dropped.
+        self.row_count = row_count
+        self.cache_rows = []
+        self.selected = {}
+        self.offset = max(0, min(self.offset, self.row_count - self.page_size()))
+        self.render()
+
+    def grow(self, row_count):
+        # More rows were appended to the source (e.g. streamed search results). Only redraw when the
+        # new rows land on screen, so the selection and scroll position survive while results arrive.
+        visible = self.row_count - self.offset
+        self.row_count = row_count
+        if visible < self.page_size():
+            self.render()
+        elif self.row_count:
+            self.scrollbar.set(self.offset / self.row_count, (self.offset + self.page_size()) / self.row_count)
+
+    def clear(self):
+        self.row_count = 0
+        self.fetch_rows = None
+        self.offset = 0
+        self.cache_rows = []
+        self.item_keys = {}
+        self.item_values = {}
+        self.selected = {}
+        self.tree.delete(*self.tree.get_children())  # One Tk call for all items
+        self.scrollbar.set(0.0, 1.0)
+
+    def visible_rows(self):
+        limit = min(self.page_size(), self.row_count - self.offset)
+        cache_end = self.cache_offset + len(self.cache_rows)
+        if self.offset < self.cache_offset or self.offset + limit > cache_end:
+            # Outside the cached window: fetch the visible rows plus overscan on both sides
+            self.cache_offset = max(0, self.offset - self.overscan)
+            self.cache_rows = self.fetch_rows(self.cache_offset, limit + 2 * self.overscan)
+        start = self.offset - self.cache_offset
+        return self.cache_rows[start:start + limit]
+
+    def render(self):
+        if self.fetch_rows is None or self.row_count == 0:
+            self.item_keys = {}
+            self.item_values = {}
+            self.tree.delete(*self.tree.get_children())
+            self.scrollbar.set(0.0, 1.0)
+            return
+
+        rows = self.visible_rows()
+        items = self.tree.get_children()
+
+        # Reuse the existing items, adding or removing only the difference
+        self.item_keys = {}
+        self.item_values = {}
+        for item, (key, values) in zip(items, rows):
+            self.tree.item(item, values=values)
+            self.item_keys[item] = key
+            self.item_values[item] = values
+        for key, values in rows[len(items):]:
+            item = self.tree.insert(parent='', index='end', values=values)
+            self.item_keys[item] = key
+            self.item_values[item] = values
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        # Different rows now sit under the items, so reselect by key
+        self.tree.selection_set([item for item, key in self.item_keys.items() if key in self.selected])
+
+        first = self.offset / self.row_count
+        last = (self.offset + len(rows)) / self.row_count
+        self.scrollbar.set(first, last)
+
+    def selected_rows(self):
+        # [(key, display values)] for every selected row, on screen or not
+        return list(self.selected.items())
+
+    def on_select(self, event):
+        # Bring the tracked selection in line with the visible items; off-screen rows keep their state
+        selection = set(self.tree.selection())
+        for item, key in self.item_keys.items():
+            if item in selection:
+                self.selected[key] = self.item_values[item]
+            else:
+                self.selected.pop(key, None)
+
+    def on_click(self, event):
+        # A plain click starts a new selection; Shift and Control extend it
+        if not event.state & (0x0001 | 0x0004):
+            self.selected = {}
+
+    def select_all(self, event=None):
+        if self.fetch_rows is not None and self.row_count:
+            self.selected = dict(self.fetch_rows(0, self.row_count))
+            self.render()
+        return "break"
+
+    def update_rows(self, changed):
+        # Rewrite rows in place after an edit that didn't add, remove or reorder rows.
+        # changed is {key: new display values}; only items showing those keys are touched.
+        self.cache_rows = [(key, changed.get(key, values)) for key, values in self.cache_rows]
+        for key in self.selected.keys() & changed.keys():
+            self.selected[key] = changed[key]
+        for item, key in self.item_keys.items():
+            if key in changed:
+                self.item_values[item] = changed[key]
+                self.tree.item(item, values=changed[key])
+
+    def scroll_to(self, offset):
+        offset = max(0, min(int(offset), self.row_count - self.page_size()))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def scroll(self, rows):
+        self.scroll_to(self.offset + rows)
+        return "break"
+
+    def yview(self, *args):
+        # Scrollbar callback: ('moveto', fraction) or ('scroll', n, 'units' | 'pages')
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.row_count)
+        elif args[0] == 'scroll':
+            step = self.page_size() if args[2] == 'pages' else 1
+            self.scroll(int(args[1]) * step)
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120 per notch; macOS reports small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self.scroll(-3 * delta)
+
+    def on_key_up(self, event):
+        items = self.tree.get_children()
+        if items and self.tree.focus() == items[0] and self.offset > 0:
+            self.scroll(-1)
+            self.tree.focus(items[0])
+            self.tree.selection_set(items[0])
+            return "break"
+
+    def on_key_down(self, event):
+        items = self.tree.get_children()
+        if items and self.tree.focus() == items[-1]:
+            self.scroll(1)
+            self.tree.focus(items[-1])
+            self.tree.selection_set(items[-1])
+            return "break"
@@ -0,0 +1,28 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+# Timing spans for the hot paths, written to the log as one JSON object per line:
+#   {"event": "span", "stage": "read_sheet", "seconds": 0.412, "rows": 50000, "workbook": "...", ...}
+# read_logs.py --summary turns them into per-stage p50/p95 durations.
+logger = logging.getLogger('pscxl.timing')
+
+@contextmanager
+def span(stage, **fields):
+    # with span('export', file=path) as record:
+    #     ...
+    #     record['rows'] = row_count
+    # Extra keys set on the record are logged with the duration. Spans cost one level check when
+    # INFO logging is off.
+    record = dict(fields)
+    if not logger.isEnabledFor(logging.INFO):
+        yield record
+        return
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - start
+        logger.info(json.dumps(dict({'event': 'span', 'stage': stage, 'seconds': round(seconds, 6)}, **record),
+                               default=str))
@@ -0,0 +1,122 @@
+import logging
+import os
+import threading
+import time
+import zipfile
+import pscxl_config
+import pscxl_ingest
+from pscxl_database import PSCXL_Database
+from pscxl_import import import_workbooks, find_workbooks
+
+# Imports workbooks dropped into a shared folder without anyone clicking "New Excel File".
+# The folder is polled rather than watched through OS notifications: it is usually a network share,
+# where inotify and friends don't see changes made from other machines. A file is only imported once
+# its size and modification time have stopped changing for settle_seconds and it opens as a zip
+# package, so half-copied workbooks are left alone until the copy finishes.
+# Every file seen is recorded in the ingest_status table, which the GUI polls to pick up new jobs.
+
+class PSCXL_Watcher:
+    def __init__(self, folder, db_name, poll_seconds=5.0, settle_seconds=2.0, max_workers=None, report=None):
+        # report(file_path, workbook_name, changed_rows, error) is called after each import
+        self.folder = os.path.abspath(folder)
+        self.db_name = db_name
+        self.poll_seconds = poll_seconds
+        self.settle_seconds = settle_seconds
+        self.max_workers = max_workers
+        self.report = report
+        self.settling = {}  # file_path: ((size, mtime), when that stat was first seen)
+        self.imported = {}  # file_path: (size, mtime) when it was last imported
+        self.reported_pending = set()  # Files already recorded as pending in ingest_status
+        self.stop_event = threading.Event()
+
+    @classmethod
+    def from_config(cls, db_name, folder=None, report=None):
+        settings = pscxl_config.load_config()['watch']
+        folder = folder or settings.get('folder')
+        if not folder:
+            raise ValueError("No folder to watch: pass one or set [watch] folder in pscxl.ini")
+        return cls(folder, db_name, settings.getfloat('poll_seconds'), settings.getfloat('settle_seconds'),
+                   settings.getint('workers') or None, report)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def scan(self):
+        # Returns (pending, ready, removed): files still settling, files ready to import and files that
+        # have gone from the folder since the last scan
+        now = time.monotonic()
+        try:
+            file_paths = find_workbooks(self.folder)
+        except OSError as e:
+            logging.error(f'Error scanning {self.folder}: {e}')
+            return [], [], set()
+
+        pending = []
+        ready = []
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue  # Deleted or renamed since the folder was listed
+            file_stat = (stat.st_size, stat.st_mtime)
+            if self.imported.get(file_path) == file_stat:
+                continue
+            previous = self.settling.get(file_path)
+            if previous is None or previous[0] != file_stat:
+                previous = self.settling[file_path] = (file_stat, now)
+            if now - previous[1] >= self.settle_seconds and zipfile.is_zipfile(file_path):
+                ready.append(file_path)
+            else:
+                pending.append(file_path)
+
+        # Forget files that have gone; their labels stay in the database
+        removed = (set(self.settling) | set(self.imported)) - set(file_paths)
+        for file_path in removed:
+            self.settling.pop(file_path, None)
+            self.imported.pop(file_path, None)
+        return pending, ready, removed
+
+    def poll(self):
+        # One scan and import pass. Returns the import results of the files that were ready.
+        pending, ready, removed = self.scan()
+        db = PSCXL_Database(self.db_name)
+        try:
+            if removed:
+                db.delete_ingest_status(removed)
+            newly_pending = [file_path for file_path in pending if file_path not in self.reported_pending]
+            if newly_pending:
+                db.set_ingest_status([(file_path, pscxl_ingest.workbook_base_name(file_path), 'pending', 0, None)
+                                      for file_path in newly_pending])
+            self.reported_pending = set(pending)
+            if not ready:
+                return []
+
+            stats = {file_path: self.settling[file_path][0] for file_path in ready}
+            db.set_ingest_status([(file_path, pscxl_ingest.workbook_base_name(file_path), 'importing', 0, None)
+                                  for file_path in ready])
+            logging.debug('Watcher importing %d files from %s', len(ready), self.folder)
+            # Files that fail aren't retried until they change again
+            results = import_workbooks(ready, self.db_name, self.max_workers)
+            db.set_ingest_status([(file_path, workbook_name, 'error' if error else 'done', changed_rows, error)
+                                  for file_path, workbook_name, changed_rows, error in results])
+        finally:
+            db.close()
+
+        for file_path, workbook_name, changed_rows, error in results:
+            self.imported[file_path] = stats[file_path]
+            self.settling.pop(file_path, None)
+            if self.report:
+                self.report(file_path, workbook_name, changed_rows, error)
+        return results
+
+    def run(self):
+        # Polls until stop() is called
+        logging.info(f'Watching {self.folder} every {self.poll_seconds}s')
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                # Keep watching; a locked database or unreadable share is usually temporary
+                logging.error(f'Error in folder watcher: {e}')
+            if self.stop_event.wait(self.poll_seconds):
+                break
@@ -0,0 +1,308 @@
+import logging
+import mmap
+import posixpath
+import tempfile
+import zipfile
+from array import array
+import xml.etree.ElementTree as ET
+from collections import Counter
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+
+# Helpers that read the xlsx zip package directly, without going through openpyxl
+
+MAIN_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+SHEET_DATA_TAG = f'{MAIN_NS}sheetData'
+ROW_TAG = f'{MAIN_NS}row'
+CELL_TAG = f'{MAIN_NS}c'
+VALUE_TAG = f'{MAIN_NS}v'
+FORMULA_TAG = f'{MAIN_NS}f'
+INLINE_STRING_TAG = f'{MAIN_NS}is'
+TEXT_TAG = f'{MAIN_NS}t'
+RUN_TAG = f'{MAIN_NS}r'
+STRING_ITEM_TAG = f'{MAIN_NS}si'
+
+class PSCXL_UnsupportedXlsx(Exception):
+    # Raised for content the direct reader doesn't handle (shared formulas, dates, unknown cell types);
+    # callers read that sheet through openpyxl instead
+    pass
+
+def rels_path(part):
+    # "xl/workbook.xml" -> "xl/_rels/workbook.xml.rels"
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, '_rels', name + '.rels')
+
+def resolve_target(part, target):
+    # Relationship targets are relative to the part's folder unless they start with "/"
+    if target.startswith('/'):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+
+def read_relationships(archive, part):
+    # {relationship id: (relationship type, target part)}
+    relationships = {}
+    try:
+        root = ET.fromstring(archive.read(rels_path(part)))
+    except KeyError:
+        return relationships
+    for rel in root.iter(f'{PACKAGE_REL_NS}Relationship'):
+        if rel.get('TargetMode') == 'External':
+            continue
+        relationships[rel.get('Id')] = (rel.get('Type', ''), resolve_target(part, rel.get('Target', '')))
+    return relationships
+
+def workbook_part(archive):
+    for rel_type, target in read_relationships(archive, '').values():
+        if rel_type.endswith('/officeDocument'):
+            return target
+    return 'xl/workbook.xml'
+
+def related_part(relationships, suffix):
+    for rel_type, target in relationships.values():
+        if rel_type.endswith(suffix):
+            return target
+    return None
+
+def sheet_parts(archive, wb_part):
+    # [(sheet name, worksheet part)] in workbook order; chartsheets are skipped
+    relationships = read_relationships(archive, wb_part)
+    root = ET.fromstring(archive.read(wb_part))
+    parts = []
+    for sheet in root.iter(f'{MAIN_NS}sheet'):
+        rel_type, target = relationships.get(sheet.get(f'{REL_NS}id'), ('', None))
+        if target and rel_type.endswith('/worksheet'):
+            parts.append((sheet.get('name'), target))
+    return parts
+
+def part_fingerprint(archive, part):
+    # The zip directory already stores a CRC32 and size for every member, so no cell data is decompressed
+    if part is None or part not in archive.NameToInfo:
+        return '-'
+    info = archive.getinfo(part)
+    return f'{info.CRC:08x}:{info.file_size}'
+
+def sheet_fingerprints(file_path):
+    # {sheet name: fingerprint} covering the sheet XML plus the shared strings and styles it depends on,
+    # so any change to a sheet's cell values changes its fingerprint. Returns {} for packages we can't read.
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            wb_part = workbook_part(archive)
+            relationships = read_relationships(archive, wb_part)
+            shared = part_fingerprint(archive, related_part(relationships, '/sharedStrings'))
+            styles = part_fingerprint(archive, related_part(relationships, '/styles'))
+            return {
+                sheet_name: f'{part_fingerprint(archive, part)}/{shared}/{styles}'
+                for sheet_name, part in sheet_parts(archive, wb_part)
+            }
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        logging.warning(f'Could not fingerprint {file_path}: {e}')
+        return {}
+
+def string_item_text(item):
+    # Plain text of a shared or inline string, as openpyxl reads it: the <t> text followed by every
+    # rich text run's <t>; phonetic runs (<rPh>) are left out
+    plain = None
+    runs = []
+    for child in item:
+        if child.tag == TEXT_TAG:
+            plain = child.text
+        elif child.tag == RUN_TAG:
+            text = None
+            for run_child in child:
+                if run_child.tag == TEXT_TAG:
+                    text = run_child.text
+            if text is not None:
+                runs.append(text)
+    if plain is not None:
+        runs.insert(0, plain)
+    return ''.join(runs)
+
+def iter_shared_strings(archive, part):
+    # Streams the shared string table, so only one <si> element is held at a time
+    if part is None or part not in archive.NameToInfo:
+        return
+    with archive.open(part) as stream:
+        table = None
+        for event, element in ET.iterparse(stream, events=('start', 'end')):
+            if event == 'start':
+                if table is None:
+                    table = element  # <sst>
+            elif element.tag == STRING_ITEM_TAG:
+                yield string_item_text(element).replace('x005F_', '')
+                table.clear()  # Drop finished items so memory stays flat
+
+def read_shared_strings(archive, part):
+    # The shared string table as a list
+    return list(iter_shared_strings(archive, part))
+
+class PSCXL_SharedStrings:
+    # Shared string table spilled to disk: the strings' UTF-8 bytes go into one temporary file, which
+    # is memory-mapped, with an array of offsets into it. Costs 8 bytes of memory per string instead
+    # of a Python str; a string is only decoded when its index is looked up, so counting works on
+    # the integer indexes and just the labels a sheet actually uses become Python strings.
+    def __init__(self, strings):
+        self.offsets = array('q', [0])
+        self.file = tempfile.TemporaryFile()
+        try:
+            chunk = []
+            chunk_size = 0
+            end = 0
+            for text in strings:
+                data = text.encode('utf-8', 'surrogatepass')
+                end += len(data)
+                self.offsets.append(end)
+                chunk.append(data)
+                chunk_size += len(data)
+                if chunk_size >= 1 << 20:
+                    self.file.write(b''.join(chunk))
+                    chunk = []
+                    chunk_size = 0
+            self.file.write(b''.join(chunk))
+            self.file.flush()
+            # An empty file can't be mapped
+            self.blob = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if end else b''
+        except Exception:
+            self.file.close()
+            raise
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('shared string index out of range')
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].decode('utf-8', 'surrogatepass')
+
+    def close(self):
+        if isinstance(self.blob, mmap.mmap):
+            self.blob.close()
+        self.file.close()
+
+def date_style_ids(archive, part):
+    # Indexes of the cell formats (the s attribute on <c>) whose number format displays a date or time;
+    # openpyxl turns numbers in those cells into datetimes
+    if part is None or part not in archive.NameToInfo:
+        return frozenset()
+    root = ET.fromstring(archive.read(part))
+    formats = dict(BUILTIN_FORMATS)
+    for number_format in root.iter(f'{MAIN_NS}numFmt'):
+        formats[int(number_format.get('numFmtId'))] = number_format.get('formatCode')
+    style_ids = set()
+    cell_formats = root.find(f'{MAIN_NS}cellXfs')
+    if cell_formats is not None:
+        for index, xf in enumerate(cell_formats.iter(f'{MAIN_NS}xf')):
+            code = formats.get(int(xf.get('numFmtId', 0)))
+            if code and is_date_format(code):
+                style_ids.add(str(index))
+    return frozenset(style_ids)
+
+def cast_number(text):
+    # Same rule as openpyxl's reader
+    if '.' in text or 'E' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+def count_sheet_cells(archive, part, shared_strings, date_styles):
+    # Count every non-empty cell value in a worksheet without building cell objects. Shared string
+    # cells, which is nearly every label, are counted by their integer index and only turned into
+    # strings once per distinct index at the end. Keys keep the order values first appear in,
+    # like count_duplicates over openpyxl's rows.
+    index_counts = Counter()  # int shared string index, or (value,) for any other cell
+    keys = []
+    with archive.open(part) as stream:
+        sheet_data = None
+        for event, element in ET.iterparse(stream, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == SHEET_DATA_TAG:
+                    sheet_data = element
+                continue
+            if tag == CELL_TAG:
+                cell_type = element.get('t', 'n')
+                formula = element.find(FORMULA_TAG)
+                if formula is not None:
+                    # openpyxl reports the formula text rather than its cached result; shared and
+                    # array formulas need translating, so those sheets go through openpyxl
+                    if formula.get('t', 'normal') != 'normal':
+                        raise PSCXL_UnsupportedXlsx(f"{formula.get('t')} formula in {element.get('r')}")
+                    keys.append(('=' + (formula.text or ''),))
+                    continue
+                if cell_type == 'inlineStr':
+                    item = element.find(INLINE_STRING_TAG)
+                    if item is not None:
+                        keys.append((string_item_text(item),))
+                    continue
+                text = element.findtext(VALUE_TAG)
+                if not text:
+                    continue
+                if cell_type == 's':
+                    keys.append(int(text))
+                elif cell_type == 'n':
+                    if element.get('s') in date_styles:
+                        raise PSCXL_UnsupportedXlsx(f"date in {element.get('r')}")
+                    keys.append((cast_number(text),))
+                elif cell_type in ('str', 'e'):
+                    keys.append((text,))
+                elif cell_type == 'b':
+                    keys.append((bool(int(text)),))
+                else:
+                    raise PSCXL_UnsupportedXlsx(f"cell type {cell_type!r} in {element.get('r')}")
+            elif tag == ROW_TAG:
+                index_counts.update(keys)
+                keys.clear()
+                # Finished rows are dropped as the parse goes, so memory stays flat on huge sheets
+                (sheet_data if sheet_data is not None else element).clear()
+    index_counts.update(keys)
+
+    counts = Counter()
+    for key, count in index_counts.items():
+        counts[shared_strings[key] if key.__class__ is int else key[0]] += count
+    return counts
+
+class PSCXL_XlsxReader:
+    # Direct reader for the label counting path: opens the package once, loads the shared strings
+    # and date styles, then counts one worksheet at a time.
+    #   with PSCXL_XlsxReader(path) as reader:
+    #       for sheet_name in reader.sheet_names:
+    # Shared string tables bigger than spill_bytes (uncompressed XML) are kept on disk in a
+    # PSCXL_SharedStrings instead of a list; None keeps every table in memory.
+    def __init__(self, file_path, spill_bytes=None):
+        self.archive = zipfile.ZipFile(file_path)
+        self.shared_strings = []
+        try:
+            wb_part = workbook_part(self.archive)
+            relationships = read_relationships(self.archive, wb_part)
+            self.parts = dict(sheet_parts(self.archive, wb_part))
+            self.sheet_names = list(self.parts)
+            strings_part = related_part(relationships, '/sharedStrings')
+            if (spill_bytes is not None and strings_part in self.archive.NameToInfo
+                    and self.archive.getinfo(strings_part).file_size > spill_bytes):
+                self.shared_strings = PSCXL_SharedStrings(iter_shared_strings(self.archive, strings_part))
+            else:
+                self.shared_strings = read_shared_strings(self.archive, strings_part)
+            self.date_styles = date_style_ids(self.archive, related_part(relationships, '/styles'))
+        except Exception:
+            self.close()
+            raise
+
+    def count_sheet(self, sheet_name):
+        try:
+            return count_sheet_cells(self.archive, self.parts[sheet_name], self.shared_strings, self.date_styles)
+        except (KeyError, IndexError, ValueError, ET.ParseError) as e:
+            # Missing parts, out-of-range indexes or malformed numbers: let openpyxl have a go
+            raise PSCXL_UnsupportedXlsx(f"{sheet_name}: {e}") from e
+
+    def close(self):
+        if isinstance(self.shared_strings, PSCXL_SharedStrings):
+            self.shared_strings.close()
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
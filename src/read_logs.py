@@ -1,11 +1,13 @@
 import argparse
+import json
+import math
 
 def parse_and_print_log(file_path, log_level=None):
     log_levels = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL']
     if log_level and log_level.upper() not in log_levels:
         print(f"Invalid log level: {log_level}. Valid levels are: {', '.join(log_levels)}")
         return
-    
+
     with open(file_path, 'r') as file:
         for line in file:
             stripped_line = line.strip()
@@ -16,11 +18,52 @@ def parse_and_print_log(file_path, log_level=None):
                 else:
                     print(stripped_line)
 
+def read_spans(file_path):
+    # Timing spans are JSON objects, either as the message of a log line or on a line of their own
+    spans = []
+    with open(file_path, 'r') as file:
+        for line in file:
+            start = line.find('{"event": "span"')
+            if start == -1:
+                continue
+            try:
+                spans.append(json.loads(line[start:]))
+            except ValueError:
+                continue  # Line cut off mid-write
+    return spans
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarise_spans(file_path):
+    durations = {}
+    rows = {}
+    for span in read_spans(file_path):
+        durations.setdefault(span['stage'], []).append(span['seconds'])
+        rows[span['stage']] = rows.get(span['stage'], 0) + (span.get('rows') or 0)
+
+    if not durations:
+        print("No timing spans found.")
+        return
+
+    print(f"{'stage':<12} {'count':>7} {'total s':>10} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'rows':>12}")
+    # Stages that took the most time overall first
+    for stage, seconds in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        seconds.sort()
+        print(f"{stage:<12} {len(seconds):>7} {sum(seconds):>10.3f} {percentile(seconds, 0.5) * 1000:>10.1f} "
+              f"{percentile(seconds, 0.95) * 1000:>10.1f} {seconds[-1] * 1000:>10.1f} {rows[stage]:>12}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Parse and print log file.")
     parser.add_argument('file_path', help="Path to the log file")
     parser.add_argument('-l', '--log_level', help="Filter logs by level (DEBUG, INFO, WARNING, ERROR, CRITICAL)", default=None)
-    
+    parser.add_argument('-s', '--summary', action='store_true', help="Summarise timing spans per stage (p50/p95 durations)")
+
     args = parser.parse_args()
-    
-    parse_and_print_log(args.file_path, args.log_level)
+
+    if args.summary:
+        summarise_spans(args.file_path)
+    else:
+        parse_and_print_log(args.file_path, args.log_level)
@@ -1,6 +1,11 @@
+import os
+import sys
 import openpyxl
 import json
-from collections import defaultdict
+
+# Use the label counting engine shared with the main application in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+import pscxl_ingest
 
 # Define the workbook name
 workbook_name = "24-0005E2.xlsx"
@@ -17,11 +22,7 @@ def read_sheet(sheet):
 
 # Function to count duplicate values in a list of lists
 def count_duplicates(data):
-    counter = defaultdict(int)
-    for row in data:
-        for value in row:
-            if value is not None:  # Skip empty cells
-                counter[value] += 1
+    counter = pscxl_ingest.count_duplicates(data)
     duplicates = {key: count for key, count in counter.items() if count > 1}
     return duplicates
 